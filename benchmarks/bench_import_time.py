@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the import time of the extractor and lookup modules.
+
+Imports each module in a fresh interpreter with python -X importtime,
+reports the median cumulative import time and the slowest modules it
+pulls in, and checks that importing the extractor neither loads the
+MySQL driver nor reads the configuration. Exits with status 1 if a
+module exceeds --budget-ms, so it can guard worker startup time in CI.
+
+Usage:
+    python benchmarks/bench_import_time.py [--runs N] [--budget-ms MS] [--top N]
+"""
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+parser = argparse.ArgumentParser(description='Benchmark module import time')
+parser.add_argument('--runs', type=int, default=10, help='Number of fresh interpreters per module')
+parser.add_argument('--budget-ms', type=float, default=None, help='Fail if a median import exceeds this')
+parser.add_argument('--top', type=int, default=5, help='Number of slowest imported modules to list')
+args = parser.parse_args()
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ('misp_db_extractor', 'ioc_lookup')
+
+# Printed by a fresh interpreter after importing the extractor
+SIDE_EFFECT_CHECK = (
+    "import sys, misp_db_extractor; "
+    "print(sorted(m for m in sys.modules if m.split('.')[0] == 'mysql'), "
+    "misp_db_extractor._config is None)"
+)
+
+
+def import_times(module):
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    Args:
+        module: Module name
+
+    Returns:
+        dict: Imported module name -> cumulative import time in microseconds
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+if __name__ == '__main__':
+    over_budget = False
+    for module in MODULES:
+        runs = [import_times(module) for _ in range(args.runs)]
+        median_ms = statistics.median(run[module] for run in runs) / 1000
+        print(f"{module:<20} {median_ms:>8.1f} ms median over {args.runs} runs")
+        slowest = sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)
+        for name, cumulative in [item for item in slowest if item[0] != module][:args.top]:
+            print(f"    {name:<28} {cumulative / 1000:>8.1f} ms")
+        if args.budget_ms is not None and median_ms > args.budget_ms:
+            print(f"    over the {args.budget_ms:.1f} ms budget")
+            over_budget = True
+
+    check = subprocess.run([sys.executable, '-c', SIDE_EFFECT_CHECK],
+                           cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    print(f"mysql modules loaded, config still unloaded after import: {check.stdout.strip()}")
+    sys.exit(1 if over_budget else 0)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the JSON serializer backends.
+
+Serializes a synthetic IOC set (with the datetime.date and Decimal values
+the MySQL driver returns) with every available backend in compact mode,
+plus the standard library in indented mode, and prints the throughput.
+
+Usage:
+    python benchmarks/bench_json_serializers.py [--rows N]
+"""
+
+import os
+import sys
+import time
+import decimal
+import datetime
+import argparse
+
+parser = argparse.ArgumentParser(description='Benchmark JSON serializer backends')
+parser.add_argument('--rows', type=int, default=1000000, help='Number of synthetic IOC rows')
+args = parser.parse_args()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import misp_db_extractor  # noqa: E402
+
+IOC_TYPES = ['ip-dst', 'domain', 'url', 'md5', 'sha256', 'filename']
+
+
+def synthetic_iocs(count):
+    """
+    Build IOC dictionaries shaped like the extractor's rows.
+
+    Args:
+        count: Number of IOCs to build
+
+    Returns:
+        list: IOC dictionaries
+    """
+    event_date = datetime.date(2025, 6, 17)
+    return [
+        {
+            'event_id': i // 1000,
+            'event_uuid': f'00000000-0000-4000-8000-{i // 1000:012d}',
+            'event_info': 'Malware Bazaar feed',
+            'event_date': event_date,
+            'event_timestamp': '2025-06-17 15:30:21',
+            'attribute_id': i,
+            'attribute_type': IOC_TYPES[i % len(IOC_TYPES)],
+            'attribute_category': 'Payload delivery',
+            'attribute_value': f'{i:064x}',
+            'attribute_timestamp': '2025-06-17 15:30:21',
+            'attribute_comment': '',
+            'attribute_to_ids': 1,
+            'score': decimal.Decimal('0.75'),
+        }
+        for i in range(count)
+    ]
+
+
+def bench(label, encode, iocs):
+    """
+    Serialize every IOC and report rows/sec and output size.
+    """
+    start = time.perf_counter()
+    size = 0
+    for ioc in iocs:
+        size += len(encode(ioc))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<18} {len(iocs) / elapsed:>12,.0f} rows/sec {size / elapsed / 1e6:>8.1f} MB/s {size / 1e6:>8.1f} MB")
+
+
+if __name__ == '__main__':
+    iocs = synthetic_iocs(args.rows)
+    for backend in misp_db_extractor.JSON_BACKENDS:
+        name, encode = misp_db_extractor.get_json_encoder(backend)
+        if name != backend:
+            print(f"{backend:<18} not installed")
+            continue
+        bench(name, encode, iocs)
+    name, encode = misp_db_extractor.get_json_encoder('stdlib', pretty=True)
+    bench('stdlib (indented)', encode, iocs)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark for batched IOC lookups.
+
+Builds a synthetic cache with save_to_cache_db and measures how many
+observables per second IOCCache.lookup resolves at batch sizes of 1, 100
+and 10,000, with 1% of the observables being known IOCs.
+
+Usage:
+    python benchmarks/bench_lookup.py [--rows N] [--lookups N]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+parser = argparse.ArgumentParser(description='Benchmark batched IOC lookups')
+parser.add_argument('--rows', type=int, default=500000, help='Number of IOCs in the synthetic cache')
+parser.add_argument('--lookups', type=int, default=100000, help='Number of observables looked up per batch size')
+args = parser.parse_args()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import misp_db_extractor  # noqa: E402
+from ioc_lookup import IOCCache  # noqa: E402
+
+BATCH_SIZES = (1, 100, 10000)
+
+
+def synthetic_iocs(count):
+    """
+    Generate IOC dictionaries with IPv4 address values.
+
+    Args:
+        count: Number of IOCs to generate
+
+    Yields:
+        dict: IOC data for a single attribute
+    """
+    for i in range(count):
+        yield {
+            'event_id': i // 1000,
+            'event_uuid': f'00000000-0000-4000-8000-{i // 1000:012d}',
+            'event_info': 'Synthetic feed',
+            'event_date': '2025-06-17',
+            'event_timestamp': '2025-06-17 15:30:21',
+            'attribute_id': i,
+            'attribute_type': 'ip-dst',
+            'attribute_category': 'Network activity',
+            'attribute_value': f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}',
+            'attribute_timestamp': '2025-06-17 15:30:21',
+            'attribute_comment': '',
+            'attribute_to_ids': 1,
+        }
+
+
+def observables(count, rows):
+    """
+    Build a list of observables of which about 1% are in the cache.
+    """
+    rng = random.Random(42)
+    values = []
+    for _ in range(count):
+        if rng.random() < 0.01:
+            i = rng.randrange(rows)
+            values.append(f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}')
+        else:
+            values.append(f'172.16.{rng.randrange(256)}.{rng.randrange(256)}')
+    return values
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'ioc_cache.db')
+        misp_db_extractor.save_to_cache_db(synthetic_iocs(args.rows), db_path)
+        values = observables(args.lookups, args.rows)
+        with IOCCache(db_path) as cache:
+            for batch_size in BATCH_SIZES:
+                start = time.perf_counter()
+                hits = 0
+                for offset in range(0, len(values), batch_size):
+                    hits += len(cache.lookup(values[offset:offset + batch_size]))
+                elapsed = time.perf_counter() - start
+                print(f"batch size {batch_size:>6} {len(values) / elapsed:>12,.0f} lookups/sec ({hits} hits)")
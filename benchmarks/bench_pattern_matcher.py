@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the compiled URL pattern matcher.
+
+Compiles a synthetic set of realistic URLs with PatternMatcher.build,
+saves it, and measures the file size, the time and peak memory a fresh
+consumer process needs to load it, and the scan throughput over a log
+text with 1% of its lines holding a known URL.
+
+Usage:
+    python benchmarks/bench_pattern_matcher.py [--patterns N] [--lines N]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+parser = argparse.ArgumentParser(description='Benchmark the URL pattern matcher')
+parser.add_argument('--patterns', type=int, default=50000, help='Number of URLs compiled into the matcher')
+parser.add_argument('--lines', type=int, default=20000, help='Number of log lines scanned')
+args = parser.parse_args()
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from ioc_lookup import PatternMatcher  # noqa: E402
+
+WORDS = ('login', 'secure', 'account', 'update', 'verify', 'cdn', 'static', 'api', 'images', 'download')
+TLDS = ('com', 'net', 'ru', 'xyz', 'top')
+
+# Run by a fresh interpreter: load the matcher and report the load time
+# and the growth of its peak resident memory
+LOAD_CHECK = (
+    "import sys, time, resource; sys.path.insert(0, {repo!r}); from ioc_lookup import PatternMatcher; "
+    "before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss; start = time.perf_counter(); "
+    "matcher = PatternMatcher.load({path!r}); elapsed = time.perf_counter() - start; "
+    "print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)"
+)
+
+
+def synthetic_urls(count):
+    """
+    Generate URLs shaped like phishing and malware IOCs.
+
+    Args:
+        count: Number of URLs to generate
+
+    Returns:
+        list: URL strings
+    """
+    rng = random.Random(42)
+    urls = []
+    for _ in range(count):
+        host = f'{rng.choice(WORDS)}-{rng.randrange(10 ** 6)}.{rng.choice(TLDS)}'
+        path = '/'.join(f'{rng.choice(WORDS)}{rng.randrange(1000)}' for _ in range(rng.randrange(1, 5)))
+        query = f'?id={rng.getrandbits(64):x}' if rng.random() < 0.5 else ''
+        urls.append(f'http://{host}/{path}{query}')
+    return urls
+
+
+def log_lines(count, urls):
+    """
+    Build proxy log lines of which about 1% request a known URL.
+    """
+    rng = random.Random(7)
+    lines = []
+    for i in range(count):
+        url = rng.choice(urls) if rng.random() < 0.01 else f'http://www.example.org/{rng.choice(WORDS)}/{i}'
+        lines.append(f'1750174221.{i % 1000:03d} 10.0.0.{i % 254 + 1} TCP_MISS/200 GET {url} - DIRECT\n')
+    return lines
+
+
+if __name__ == '__main__':
+    urls = synthetic_urls(args.patterns)
+    start = time.perf_counter()
+    matcher = PatternMatcher.build((url, i) for i, url in enumerate(urls))
+    print(f"build {time.perf_counter() - start:>8.2f} s ({matcher.num_states:,} states)")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'ioc_patterns.bin')
+        start = time.perf_counter()
+        matcher.save(path)
+        print(f"save  {time.perf_counter() - start:>8.2f} s ({os.path.getsize(path) / 1e6:.1f} MB)")
+        result = subprocess.run([sys.executable, '-c', LOAD_CHECK.format(repo=REPO_DIR, path=path)],
+                                capture_output=True, text=True, check=True)
+        elapsed, peak_kb = result.stdout.split()
+        print(f"load  {float(elapsed):>8.3f} s (peak memory +{int(peak_kb) / 1024:.0f} MB)")
+        loaded = PatternMatcher.load(path)
+        lines = log_lines(args.lines, urls)
+        characters = sum(len(line) for line in lines)
+        start = time.perf_counter()
+        hits = sum(1 for _ in loaded.scan_stream(lines))
+        elapsed = time.perf_counter() - start
+        print(f"scan  {characters / elapsed / 1e6:>8.2f} M characters/sec ({hits} hits)")
+        loaded.close()
@@ -0,0 +1,1531 @@
+"""
+IOC Cache Lookups
+
+This module gives downstream components a first-class interface to the
+SQLite cache written by misp_db_extractor.py. Observables are checked in
+batches with set-based queries instead of one query per value.
+
+Usage:
+    from ioc_lookup import IOCCache
+
+    with IOCCache('ioc_cache.db') as cache:
+        matches = cache.lookup(['192.0.2.123', 'evil.example'])
+        blocks = cache.match_ips(['198.51.100.7', '2001:db8::1'])
+        parents = cache.match_domains(['a.b.evil.example'])
+        samples = cache.match_hashes(['44d88612fea8a8f36de82e1278abb02f'])
+        rule = cache.get_content(attribute_id)
+
+    matcher = PatternMatcher.load('ioc_patterns.bin')
+    for start, end, pattern in matcher.scan_stream(open('proxy.log')):
+        ...
+
+    index = IOCIndex('ioc_cache.db')
+    index.start_auto_refresh()
+    if index.contains('192.0.2.123'):
+        ...
+
+The module only depends on the Python standard library and can be
+imported without touching the MISP database or the extractor
+configuration.
+"""
+
+import os
+import re
+import sys
+import mmap
+import math
+import array
+import bisect
+import struct
+import hashlib
+import ipaddress
+import zlib
+import sqlite3
+import logging
+import threading
+import functools
+import collections
+import urllib.parse
+
+# Set up the script directory
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger('ioc_lookup')
+
+# Number of values bound per IN (...) query
+LOOKUP_CHUNK_SIZE = 500
+
+# Bloom filter file header: magic, format version, number of hash
+# functions, number of bits, number of items, cache generation
+BLOOM_MAGIC = b'IOCBLOOM'
+BLOOM_HEADER = struct.Struct('<8sIIQQ32s')
+
+# Pattern matcher file header: magic, format version, flags, number of
+# states, transitions, patterns and attribute ids, length of the pattern
+# text, cache generation. It is followed by the little-endian tables of
+# the automaton and the UTF-8 pattern text
+PATTERN_MAGIC = b'IOCMATCH'
+PATTERN_HEADER = struct.Struct('<8sIIQQQQQ32s')
+PATTERN_CASE_SENSITIVE = 1
+PATTERN_ITEM_SIZES = {'q': 8, 'I': 4, 'i': 4}
+
+# Defanging conventions undone before values are compared
+REFANG_REPLACEMENTS = (
+    ('[.]', '.'), ('(.)', '.'), ('{.}', '.'), ('[dot]', '.'), ('(dot)', '.'),
+    ('[://]', '://'), ('[:]', ':'), ('[@]', '@'), ('[at]', '@'),
+)
+REFANG_SCHEMES = re.compile(r'^(hxxp|hxxps|fxp)(?=://)', re.IGNORECASE)
+REFANG_SCHEME_NAMES = {'hxxp': 'http', 'hxxps': 'https', 'fxp': 'ftp'}
+
+# Ports dropped from normalised URLs
+DEFAULT_PORTS = {'http': 80, 'https': 443, 'ftp': 21}
+
+# Values that are already in canonical form, so the common cases skip the
+# ipaddress and urllib parsers: dotted-quad IPv4 addresses without leading
+# zeros, and URLs with a lowercase scheme and host, no port or user info
+# and a path
+IPV4_ADDRESS = re.compile(r'(?:(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])\.){3}(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])')
+CANONICAL_URL = re.compile(r'(?:https?|ftp)://[a-z0-9-]+(?:\.[a-z0-9-]+)*/[!-~]*')
+
+# Attribute types whose values are hex digests and compared case-insensitively
+HASH_ATTRIBUTE_TYPES = (
+    'md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512', 'sha512/224', 'sha512/256',
+    'sha3-224', 'sha3-256', 'sha3-384', 'sha3-512', 'imphash', 'authentihash', 'tlsh',
+    'x509-fingerprint-md5', 'x509-fingerprint-sha1', 'x509-fingerprint-sha256',
+    'ja3-fingerprint-md5',
+)
+
+# Hash attribute types stored as binary digests: table and digest size
+HASH_TABLES = {
+    'md5': ('hash_md5', 16),
+    'sha1': ('hash_sha1', 20),
+    'sha256': ('hash_sha256', 32),
+}
+
+# Attribute types whose values are rule bodies; the cache keeps them in
+# attribute_content and only their sha256 digest in attributes
+CONTENT_ATTRIBUTE_TYPES = ('snort', 'yara', 'sigma')
+
+# Attribute types compiled into the substring matcher
+PATTERN_ATTRIBUTE_TYPES = ('url', 'filename', 'mutex')
+
+# Attribute types holding an IP address, CIDR block or range, mapped to
+# the position of the address in composite values such as ip-dst|port
+IP_ATTRIBUTE_TYPES = {
+    'ip-src': 0,
+    'ip-dst': 0,
+    'ip-src|port': 0,
+    'ip-dst|port': 0,
+    'domain|ip': 1,
+}
+
+# Attribute types holding a domain or hostname, mapped to the position of
+# the name in composite values
+DOMAIN_ATTRIBUTE_TYPES = {
+    'domain': 0,
+    'hostname': 0,
+    'domain|ip': 0,
+    'hostname|port': 0,
+}
+
+
+def open_cache_db(db_path):
+    """
+    Open the cache database read-only.
+
+    Args:
+        db_path: Path to the SQLite database file
+
+    Returns:
+        sqlite3.Connection: Connection returning sqlite3.Row rows
+    """
+    uri = 'file:' + os.path.abspath(db_path).replace('?', '%3f').replace('#', '%23') + '?mode=ro'
+    connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def chunked(values, size):
+    """
+    Split a list into consecutive slices of at most size items.
+
+    Args:
+        values: List to split
+        size: Maximum slice length
+
+    Yields:
+        list: Consecutive slices of values
+    """
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def type_condition(attribute_types):
+    """
+    Build the optional attribute type restriction of a lookup query.
+
+    Args:
+        attribute_types: Iterable of MISP attribute types, or None
+
+    Returns:
+        tuple: (SQL fragment to append to a WHERE clause, its parameters)
+    """
+    if not attribute_types:
+        return '', []
+    type_params = list(attribute_types)
+    return ' AND attribute_type IN ({})'.format(','.join('?' * len(type_params))), type_params
+
+
+def refang(value):
+    """
+    Undo the usual defanging of domains, URLs and e-mail addresses.
+
+    Args:
+        value: Possibly defanged value, such as "hxxp://evil[.]example"
+
+    Returns:
+        str: Refanged value
+    """
+    # Every defanged form has brackets or starts with a defanged scheme
+    if '[' in value or '(' in value or '{' in value:
+        for defanged, fanged in REFANG_REPLACEMENTS:
+            if defanged in value:
+                value = value.replace(defanged, fanged)
+    if value[:3].lower() not in ('hxx', 'fxp'):
+        return value
+    return REFANG_SCHEMES.sub(lambda match: REFANG_SCHEME_NAMES[match.group(1).lower()], value)
+
+
+def canonicalize_text(value):
+    """Canonical form of a value without a type-specific rule: trimmed."""
+    return value.strip()
+
+
+def canonicalize_hash(value):
+    """Canonical form of a hex digest: trimmed and lowercased."""
+    return value.strip().lower()
+
+
+def canonicalize_domain(value):
+    """Canonical form of a domain or hostname: refanged, lowercased, no trailing dot."""
+    return refang(value.strip()).rstrip('.').lower()
+
+
+def canonicalize_email(value):
+    """Canonical form of an e-mail address: refanged and lowercased."""
+    return refang(value.strip()).lower()
+
+
+def canonicalize_ip(value):
+    """
+    Canonical form of an IP address or CIDR block.
+
+    IPv6 addresses are compressed and lowercased. Values that do not parse,
+    such as ranges, are only trimmed and refanged.
+    """
+    value = refang(value.strip())
+    address = value.strip('[]')
+    if IPV4_ADDRESS.fullmatch(address):
+        return address
+    if '.' not in address and ':' not in address:
+        return value
+    try:
+        if '/' in address:
+            return str(ipaddress.ip_interface(address))
+        return str(ipaddress.ip_address(address))
+    except ValueError:
+        return value
+
+
+def canonicalize_url(value):
+    """
+    Canonical form of a URL.
+
+    The URL is refanged, its scheme and host are lowercased, the default
+    port and a trailing dot on the host are dropped and an empty path
+    becomes "/". Values without a scheme and host are only trimmed and
+    refanged.
+    """
+    value = refang(value.strip())
+    # An empty query or fragment would be dropped by urlunsplit
+    if CANONICAL_URL.fullmatch(value) and not value.endswith(('?', '#')) and '?#' not in value:
+        return value
+    try:
+        parts = urllib.parse.urlsplit(value)
+        host = parts.hostname
+        port = parts.port
+    except ValueError:
+        return value
+    if not parts.scheme or not host:
+        return value
+    scheme = parts.scheme.lower()
+    host = host.rstrip('.')
+    if ':' in host:
+        host = '[' + canonicalize_ip(host) + ']'
+    netloc = host
+    if port is not None and DEFAULT_PORTS.get(scheme) != port:
+        netloc += f':{port}'
+    if '@' in parts.netloc:
+        netloc = parts.netloc.rsplit('@', 1)[0] + '@' + netloc
+    return urllib.parse.urlunsplit((scheme, netloc, parts.path or '/', parts.query, parts.fragment))
+
+
+# Canonicalisation rule of each attribute type; other types only get
+# trimmed, and composite types apply the rule of each component
+CANONICAL_RULES = dict.fromkeys(HASH_ATTRIBUTE_TYPES, canonicalize_hash)
+CANONICAL_RULES.update({
+    'domain': canonicalize_domain,
+    'hostname': canonicalize_domain,
+    'ip-src': canonicalize_ip,
+    'ip-dst': canonicalize_ip,
+    'url': canonicalize_url,
+    'uri': canonicalize_url,
+    'link': canonicalize_url,
+    'email': canonicalize_email,
+    'email-src': canonicalize_email,
+    'email-dst': canonicalize_email,
+})
+
+# Rules an untyped observable is canonicalised with for lookups
+LOOKUP_RULES = (
+    canonicalize_text, canonicalize_hash, canonicalize_domain,
+    canonicalize_ip, canonicalize_url, canonicalize_email,
+)
+
+
+@functools.lru_cache(maxsize=None)
+def canonical_rule(attribute_type):
+    """
+    Get the canonicalisation function of a MISP attribute type.
+
+    Args:
+        attribute_type: MISP attribute type
+
+    Returns:
+        callable: Function mapping a value of this type to its canonical form
+    """
+    rule = CANONICAL_RULES.get(attribute_type)
+    if rule is not None:
+        return rule
+    if '|' in attribute_type:
+        rules = [canonical_rule(component) for component in attribute_type.split('|')]
+
+        def canonicalize_composite(value):
+            parts = value.split('|')
+            if len(parts) != len(rules):
+                return canonicalize_text(value)
+            return '|'.join(rule(part) for rule, part in zip(rules, parts))
+        return canonicalize_composite
+    return canonicalize_text
+
+
+def canonicalize_value(attribute_type, value):
+    """
+    Canonicalise an IOC value according to its attribute type.
+
+    Args:
+        attribute_type: MISP attribute type
+        value: Attribute value
+
+    Returns:
+        str: Canonical value, or None if value is None
+    """
+    if value is None:
+        return None
+    return canonical_rule(attribute_type)(value)
+
+
+def canonical_forms(value, attribute_types=None):
+    """
+    Get the canonical forms an observable could be stored under.
+
+    An observable has no type, so it is canonicalised with the rule of
+    each given attribute type, or with every lookup rule.
+
+    Args:
+        value: Observable string
+        attribute_types: MISP attribute types the observable is matched against (optional)
+
+    Returns:
+        set: Candidate canonical values
+    """
+    if attribute_types:
+        rules = {canonical_rule(attribute_type) for attribute_type in attribute_types}
+    else:
+        rules = LOOKUP_RULES
+    return {rule(value) for rule in rules}
+
+
+def parse_ip_networks(attribute_type, value):
+    """
+    Parse the address, CIDR block or range of an IP attribute into networks.
+
+    Single addresses become host networks, CIDR blocks are normalised to
+    their network address and ranges written as "first - last" are split
+    into the CIDR blocks covering them.
+
+    Args:
+        attribute_type: MISP attribute type
+        value: Attribute value
+
+    Returns:
+        list: (ip_version, prefix_length, packed network address) tuples,
+            empty if the value is not an IP attribute
+    """
+    position = IP_ATTRIBUTE_TYPES.get(attribute_type)
+    if position is None or not value:
+        return []
+    if '|' in attribute_type:
+        parts = value.split('|')
+        if len(parts) <= position:
+            return []
+        value = parts[position]
+    value = value.strip().strip('[]')
+    if IPV4_ADDRESS.fullmatch(value):
+        return [(4, 32, bytes(map(int, value.split('.'))))]
+    if '.' not in value and ':' not in value:
+        return []
+    try:
+        if '-' in value:
+            first, last = (ipaddress.ip_address(part.strip()) for part in value.split('-', 1))
+            networks = ipaddress.summarize_address_range(first, last)
+        else:
+            networks = [ipaddress.ip_network(value, strict=False)]
+        return [(n.version, n.prefixlen, n.network_address.packed) for n in networks]
+    except (TypeError, ValueError):
+        return []
+
+
+def reverse_domain(name):
+    """
+    Reverse the labels of a domain name for the domain_names suffix index.
+
+    "a.b.evil.example" becomes "example.evil.b.a.", so every parent domain
+    of a name is a prefix of it ending at a dot.
+
+    Args:
+        name: Domain or hostname
+
+    Returns:
+        str: Lowercased reversed name with a trailing dot, or None if empty
+    """
+    labels = name.strip().strip('.').lower().split('.')
+    if not labels[0]:
+        return None
+    return '.'.join(reversed(labels)) + '.'
+
+
+def parse_domain_name(attribute_type, value):
+    """
+    Extract the reversed domain name of a domain or hostname attribute.
+
+    Args:
+        attribute_type: MISP attribute type
+        value: Attribute value
+
+    Returns:
+        str: Reversed name as built by reverse_domain, or None if the value
+            is not a domain attribute
+    """
+    position = DOMAIN_ATTRIBUTE_TYPES.get(attribute_type)
+    if position is None or not value:
+        return None
+    if '|' in attribute_type:
+        parts = value.split('|')
+        if len(parts) <= position:
+            return None
+        value = parts[position]
+    return reverse_domain(value)
+
+
+def parse_hash_digests(attribute_type, value):
+    """
+    Decode the md5, sha1 and sha256 digests of a hash attribute.
+
+    Composite types such as filename|sha256 yield the digest of their hash
+    part.
+
+    Args:
+        attribute_type: MISP attribute type
+        value: Attribute value
+
+    Returns:
+        list: (table, digest bytes) tuples, empty if the value holds no
+            valid digest of a stored type
+    """
+    if not value:
+        return []
+    attribute_types = attribute_type.split('|')
+    parts = value.split('|') if len(attribute_types) > 1 else [value]
+    if len(parts) != len(attribute_types):
+        return []
+    digests = []
+    for part_type, part in zip(attribute_types, parts):
+        table = HASH_TABLES.get(part_type)
+        if table is None:
+            continue
+        try:
+            digest = bytes.fromhex(part.strip())
+        except ValueError:
+            continue
+        if len(digest) == table[1]:
+            digests.append((table[0], digest))
+    return digests
+
+
+def compress_content(compression, content):
+    """
+    Encode a rule body for the attribute_content table.
+
+    Args:
+        compression: "zlib", "zstd" or "none"
+        content: Rule body
+
+    Returns:
+        bytes: Encoded content
+    """
+    data = content.encode('utf-8')
+    if compression == 'zlib':
+        return zlib.compress(data)
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def decompress_content(compression, data):
+    """
+    Decode a rule body read from the attribute_content table.
+
+    Args:
+        compression: Compression the content was stored with
+        data: Encoded content
+
+    Returns:
+        str: Rule body
+    """
+    if compression == 'zlib':
+        data = zlib.decompress(data)
+    elif compression == 'zstd':
+        import zstandard
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return data.decode('utf-8')
+
+
+class BloomFilter:
+    """
+    Bloom filter over IOC values, stored as a memory-mappable sidecar file.
+
+    A negative answer is definite, so callers can reject the vast majority
+    of observables without touching SQLite and only query the cache for
+    probable matches. Bit positions come from one blake2b digest per value
+    split into two 64-bit hashes (double hashing).
+    """
+
+    def __init__(self, num_bits, num_hashes, bits, num_items=0, generation=None):
+        """
+        Args:
+            num_bits: Size of the bit array
+            num_hashes: Number of bit positions per value
+            bits: bytearray or mmap holding the bit array
+            num_items: Number of values added
+            generation: Cache generation the filter was built from
+        """
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits
+        self.num_items = num_items
+        self.generation = generation
+        self._file = None
+
+    @classmethod
+    def create(cls, expected_items, fp_rate=0.001, generation=None):
+        """
+        Create an empty filter sized for a number of values.
+
+        Args:
+            expected_items: Number of values that will be added
+            fp_rate: Target false-positive rate
+            generation: Cache generation the filter is built from
+
+        Returns:
+            BloomFilter: Empty filter
+        """
+        expected_items = max(expected_items, 1)
+        num_bits = max(int(math.ceil(-expected_items * math.log(fp_rate) / math.log(2) ** 2)), 64)
+        num_bits = (num_bits + 7) // 8 * 8
+        num_hashes = max(int(round(num_bits / expected_items * math.log(2))), 1)
+        return cls(num_bits, num_hashes, bytearray(num_bits // 8), generation=generation)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Memory-map a filter file read-only.
+
+        Args:
+            path: Path to the filter file
+
+        Returns:
+            BloomFilter: Filter backed by the mapped file
+        """
+        f = open(path, 'rb')
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            f.close()
+            raise
+        magic, version, num_hashes, num_bits, num_items, generation = BLOOM_HEADER.unpack_from(mapped)
+        if magic != BLOOM_MAGIC or version != 1:
+            mapped.close()
+            f.close()
+            raise ValueError(f"{path} is not an IOC bloom filter")
+        bits = memoryview(mapped)[BLOOM_HEADER.size:]
+        bloom = cls(num_bits, num_hashes, bits, num_items, generation.rstrip(b'\0').decode('ascii') or None)
+        bloom._file = (f, mapped)
+        return bloom
+
+    def close(self):
+        """Unmap the filter file, if the filter was opened from one."""
+        if self._file is not None:
+            f, mapped = self._file
+            self.bits.release()
+            mapped.close()
+            f.close()
+            self._file = None
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, value):
+        """
+        Add a value to the filter.
+
+        Args:
+            value: IOC value
+        """
+        bits = self.bits
+        for position in self._positions(value):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.num_items += 1
+
+    def __contains__(self, value):
+        bits = self.bits
+        for position in self._positions(value):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def save(self, path):
+        """
+        Write the filter to a file, replacing it atomically.
+
+        Args:
+            path: Path to the filter file
+        """
+        generation = (self.generation or '').encode('ascii')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, 1, self.num_hashes, self.num_bits,
+                                      self.num_items, generation))
+            f.write(self.bits)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+class PatternMatcher:
+    """
+    Aho-Corasick automaton finding IOC values anywhere in a text.
+
+    The automaton is compiled once from the url, filename and mutex IOCs by
+    the extractor and saved next to the cache, so consumers load it instead
+    of rebuilding it. A text or a stream of chunks is scanned in a single
+    pass regardless of the number of patterns, and matches spanning chunk
+    boundaries are found because the automaton state carries over.
+
+    The automaton is held in flat integer arrays: the transitions of each
+    state are a sorted run of (character, next state) pairs located through
+    trans_start. A saved matcher is memory-mapped like the bloom filter,
+    so loading it costs little time or memory however many states it has.
+
+    Matching is case-insensitive unless the matcher was built with
+    case_sensitive=True; offsets then refer to the lowercased text.
+    """
+
+    def __init__(self, patterns, id_offsets, ids, trans_start, trans_chars, trans_next,
+                 fail, output, dict_link, case_sensitive=False, generation=None):
+        """
+        Args:
+            patterns: List of pattern strings
+            id_offsets: Start of the attribute ids of each pattern in ids,
+                followed by the total number of ids
+            ids: Attribute ids of all patterns
+            trans_start: Start of the transitions of each state, followed
+                by the total number of transitions
+            trans_chars: Code point of each transition, sorted per state
+            trans_next: Target state of each transition
+            fail: Failure link of each state
+            output: Index of the pattern ending at each state, or -1
+            dict_link: Nearest state on the failure chain with an output, or -1
+            case_sensitive: Whether patterns and text are compared as is
+            generation: Cache generation the matcher was built from
+        """
+        self.patterns = patterns
+        self.id_offsets = id_offsets
+        self.ids = ids
+        self.trans_start = trans_start
+        self.trans_chars = trans_chars
+        self.trans_next = trans_next
+        self.fail = fail
+        self.output = output
+        self.dict_link = dict_link
+        self.case_sensitive = case_sensitive
+        self.generation = generation
+        self.num_states = len(fail)
+        # Most characters of a text are looked up from the root
+        self._root = {trans_chars[i]: trans_next[i] for i in range(trans_start[0], trans_start[1])}
+        self._file = None
+
+    @classmethod
+    def build(cls, patterns, case_sensitive=False, generation=None):
+        """
+        Compile an automaton from a set of patterns.
+
+        Args:
+            patterns: Iterable of (pattern, attribute id) pairs
+            case_sensitive: Compare patterns and text as is
+            generation: Cache generation the patterns were read from
+
+        Returns:
+            PatternMatcher: Compiled matcher
+        """
+        goto = [{}]
+        output = [-1]
+        keys = []
+        pattern_ids = []
+        for pattern, attribute_id in patterns:
+            key = pattern if case_sensitive else pattern.lower()
+            if not key:
+                continue
+            state = 0
+            for char in key:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    output.append(-1)
+                state = next_state
+            if output[state] < 0:
+                output[state] = len(keys)
+                keys.append(key)
+                pattern_ids.append([])
+            pattern_ids[output[state]].append(attribute_id)
+
+        # Failure links in breadth-first order, so the link of a state is
+        # always computed before the states below it
+        fail = array.array('I', bytes(4 * len(goto)))
+        dict_link = array.array('i', [-1]) * len(goto)
+        queue = collections.deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                link = fail[state]
+                while link and char not in goto[link]:
+                    link = fail[link]
+                link = goto[link].get(char, 0)
+                fail[next_state] = link
+                dict_link[next_state] = link if output[link] >= 0 else dict_link[link]
+
+        # Flatten the transition dictionaries, freeing them as we go
+        trans_start = array.array('I', [0])
+        trans_chars = array.array('I')
+        trans_next = array.array('I')
+        for state, edges in enumerate(goto):
+            for char in sorted(edges):
+                trans_chars.append(ord(char))
+                trans_next.append(edges[char])
+            trans_start.append(len(trans_chars))
+            goto[state] = None
+        id_offsets = array.array('I', [0])
+        ids = array.array('q')
+        for attribute_ids in pattern_ids:
+            ids.extend(attribute_ids)
+            id_offsets.append(len(ids))
+        return cls(keys, id_offsets, ids, trans_start, trans_chars, trans_next, fail,
+                   array.array('i', output), dict_link, case_sensitive, generation)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-map a matcher saved by save() read-only.
+
+        Args:
+            path: Path to the matcher file
+
+        Returns:
+            PatternMatcher: Matcher backed by the mapped file
+        """
+        f = open(path, 'rb')
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            f.close()
+            raise
+        view = None
+        tables = []
+        try:
+            if len(mapped) < PATTERN_HEADER.size:
+                raise ValueError(f"{path} is not an IOC pattern matcher")
+            (magic, version, flags, num_states, num_transitions, num_patterns, num_ids, text_length,
+             generation) = PATTERN_HEADER.unpack_from(mapped)
+            if magic != PATTERN_MAGIC or version != 2:
+                raise ValueError(f"{path} is not an IOC pattern matcher")
+            view = memoryview(mapped)
+            offset = PATTERN_HEADER.size
+            for typecode, count in (('q', num_ids), ('I', num_patterns + 1), ('I', num_patterns + 1),
+                                    ('I', num_states + 1), ('I', num_transitions), ('I', num_transitions),
+                                    ('I', num_states), ('i', num_states), ('i', num_states)):
+                size = count * PATTERN_ITEM_SIZES[typecode]
+                table = view[offset:offset + size].cast(typecode)
+                if sys.byteorder != 'little':
+                    table = array.array(typecode, table)
+                    table.byteswap()
+                tables.append(table)
+                offset += size
+            ids, id_offsets, pattern_offsets = tables[:3]
+            text = str(view[offset:], 'utf-8')
+            if len(text) != text_length:
+                raise ValueError(f"{path} is truncated")
+        except Exception:
+            for table in tables + [view]:
+                if isinstance(table, memoryview):
+                    table.release()
+            mapped.close()
+            f.close()
+            raise
+        patterns = [text[pattern_offsets[i]:pattern_offsets[i + 1]] for i in range(num_patterns)]
+        matcher = cls(patterns, id_offsets, ids, *tables[3:], case_sensitive=bool(flags & PATTERN_CASE_SENSITIVE),
+                      generation=generation.rstrip(b'\0').decode('ascii') or None)
+        matcher._file = (f, mapped, [view, pattern_offsets])
+        return matcher
+
+    def close(self):
+        """Unmap the matcher file, if the matcher was loaded from one."""
+        if self._file is not None:
+            f, mapped, views = self._file
+            for table in views + [self.id_offsets, self.ids, self.trans_start, self.trans_chars,
+                                  self.trans_next, self.fail, self.output, self.dict_link]:
+                if isinstance(table, memoryview):
+                    table.release()
+            mapped.close()
+            f.close()
+            self._file = None
+
+    def save(self, path):
+        """
+        Write the compiled matcher to a file, replacing it atomically.
+
+        Args:
+            path: Path to the matcher file
+        """
+        pattern_offsets = array.array('I', [0])
+        for pattern in self.patterns:
+            pattern_offsets.append(pattern_offsets[-1] + len(pattern))
+        generation = (self.generation or '').encode('ascii')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(PATTERN_HEADER.pack(
+                PATTERN_MAGIC, 2, PATTERN_CASE_SENSITIVE if self.case_sensitive else 0, self.num_states,
+                len(self.trans_chars), len(self.patterns), len(self.ids), pattern_offsets[-1], generation))
+            for typecode, table in (('q', self.ids), ('I', self.id_offsets), ('I', pattern_offsets),
+                                    ('I', self.trans_start), ('I', self.trans_chars), ('I', self.trans_next),
+                                    ('I', self.fail), ('i', self.output), ('i', self.dict_link)):
+                if sys.byteorder != 'little':
+                    table = array.array(typecode, table)
+                    table.byteswap()
+                f.write(table)
+            f.write(''.join(self.patterns).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def _next_state(self, state, code):
+        # Target of the transition on a code point, or -1
+        if not state:
+            return self._root.get(code, -1)
+        start = self.trans_start[state]
+        end = self.trans_start[state + 1]
+        index = bisect.bisect_left(self.trans_chars, code, start, end)
+        if index < end and self.trans_chars[index] == code:
+            return self.trans_next[index]
+        return -1
+
+    def scan_stream(self, chunks):
+        """
+        Find every pattern occurrence in a stream of text chunks.
+
+        Args:
+            chunks: Iterable of strings, such as the lines of a log file
+
+        Yields:
+            tuple: (start offset, end offset, pattern) of each occurrence,
+                with offsets counted from the start of the stream
+        """
+        root = self._root
+        trans_start = self.trans_start
+        trans_chars = self.trans_chars
+        trans_next = self.trans_next
+        fail = self.fail
+        output = self.output
+        dict_link = self.dict_link
+        patterns = self.patterns
+        bisect_left = bisect.bisect_left
+        state = 0
+        offset = 0
+        for chunk in chunks:
+            if not self.case_sensitive:
+                chunk = chunk.lower()
+            for position, char in enumerate(chunk):
+                code = ord(char)
+                while state:
+                    start = trans_start[state]
+                    end = trans_start[state + 1]
+                    # Most states below the root have a single transition
+                    if end - start == 1:
+                        if trans_chars[start] == code:
+                            state = trans_next[start]
+                            break
+                    elif start < end:
+                        index = bisect_left(trans_chars, code, start, end)
+                        if index < end and trans_chars[index] == code:
+                            state = trans_next[index]
+                            break
+                    state = fail[state]
+                else:
+                    state = root.get(code, 0)
+                match = state if output[state] >= 0 else dict_link[state]
+                while match >= 0:
+                    pattern = patterns[output[match]]
+                    end = offset + position + 1
+                    yield end - len(pattern), end, pattern
+                    match = dict_link[match]
+            offset += len(chunk)
+
+    def scan(self, text):
+        """
+        Find every pattern occurrence in a text.
+
+        Args:
+            text: String to scan
+
+        Returns:
+            list: (start offset, end offset, pattern) tuples
+        """
+        return list(self.scan_stream([text]))
+
+    def attribute_ids(self, pattern):
+        """
+        Look up the IOCs a matched pattern came from.
+
+        Args:
+            pattern: Pattern as returned by scan()
+
+        Returns:
+            list: Attribute ids of the IOCs with this value
+        """
+        key = pattern if self.case_sensitive else pattern.lower()
+        state = 0
+        for char in key:
+            state = self._next_state(state, ord(char))
+            if state < 0:
+                return []
+        index = self.output[state]
+        if index < 0:
+            return []
+        return list(self.ids[self.id_offsets[index]:self.id_offsets[index + 1]])
+
+
+class IOCCache:
+    """
+    Batched lookups of observables against the IOC cache database.
+
+    The database is opened read-only. When the extractor swaps in a new
+    cache generation, the connection is reopened on the next call.
+
+    If the extractor's bloom filter sidecar is given, observables it
+    rejects are never sent to SQLite. The filter is only trusted while it
+    was built from the cache generation currently in the database.
+
+    IP observables can also be matched against network-block IOCs with
+    match_ips, which probes the ip_networks table once per prefix length
+    present in the cache, hostnames against their parent domains with
+    match_domains, and hashes against the binary digest tables with
+    match_hashes.
+    """
+
+    def __init__(self, db_path=None, chunk_size=LOOKUP_CHUNK_SIZE, bloom_path=None):
+        """
+        Args:
+            db_path: Path to the SQLite database file (None will use ioc_cache.db
+                next to this module)
+            chunk_size: Number of values bound per query
+            bloom_path: Path to the bloom filter sidecar (optional)
+        """
+        if db_path is None:
+            db_path = os.path.join(SCRIPT_DIR, 'ioc_cache.db')
+        self.db_path = db_path
+        self.chunk_size = chunk_size
+        self.bloom_path = bloom_path
+        self.bloom = None
+        self.connection = None
+        self._file_id = None
+        self._bloom_file_id = None
+        # (cache generation, prefix lengths per IP version)
+        self._ip_prefixes = (None, {})
+        self._open()
+        self._open_bloom()
+
+    def _open(self):
+        """Open a connection to the current cache file."""
+        if self.connection is not None:
+            self.connection.close()
+        stat = os.stat(self.db_path)
+        self.connection = open_cache_db(self.db_path)
+        self._file_id = (stat.st_dev, stat.st_ino)
+        logger.info(f"Opened IOC cache {self.db_path}")
+
+    def _open_bloom(self):
+        """Map the current bloom filter file, if one is configured."""
+        if self.bloom is not None:
+            self.bloom.close()
+            self.bloom = None
+        self._bloom_file_id = None
+        if not self.bloom_path:
+            return
+        try:
+            stat = os.stat(self.bloom_path)
+            self.bloom = BloomFilter.open(self.bloom_path)
+            self._bloom_file_id = (stat.st_dev, stat.st_ino)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not open bloom filter {self.bloom_path}: {e}")
+
+    def refresh(self):
+        """
+        Reopen the database or bloom filter if a new generation replaced the file.
+
+        Returns:
+            bool: True if the connection was reopened
+        """
+        if self.bloom_path:
+            try:
+                stat = os.stat(self.bloom_path)
+                if (stat.st_dev, stat.st_ino) != self._bloom_file_id:
+                    self._open_bloom()
+            except OSError:
+                pass
+        try:
+            stat = os.stat(self.db_path)
+        except OSError:
+            return False
+        if (stat.st_dev, stat.st_ino) == self._file_id:
+            return False
+        self._open()
+        return True
+
+    def _generation(self):
+        """Read the cache generation of the open database."""
+        row = self.connection.execute(
+            "SELECT value FROM extractor_state WHERE key = 'cache_generation'").fetchone()
+        return row[0] if row else None
+
+    def _bloom_candidates(self, values):
+        """Drop the canonical values the bloom filter rules out, if it is current."""
+        if self.bloom is None:
+            return values
+        generation = self._generation()
+        if generation is None or generation != self.bloom.generation:
+            return values
+        bloom = self.bloom
+        return [value for value in values if value in bloom]
+
+    def close(self):
+        """Close the database connection and bloom filter."""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        if self.bloom is not None:
+            self.bloom.close()
+            self.bloom = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _canonical_batch(self, values, attribute_types):
+        """Map each candidate canonical form of a batch to its observables."""
+        forms = {}
+        for value in dict.fromkeys(values):
+            for form in canonical_forms(value, attribute_types):
+                forms.setdefault(form, []).append(value)
+        return forms
+
+    def lookup(self, values, attribute_types=None):
+        """
+        Find the cached IOCs matching a batch of observables.
+
+        Observables are compared by canonical value, so "EVIL.example." or
+        "evil[.]example" match an evil.example IOC. The candidate canonical
+        forms of the batch are resolved with one IN (...) query per
+        chunk_size values over idx_canonical_value, and a match is kept only
+        if the observable canonicalises to the IOC's value under the IOC's
+        own attribute type.
+
+        Args:
+            values: Iterable of observable strings
+            attribute_types: Only match IOCs of these MISP attribute types (optional)
+
+        Returns:
+            dict: Observable -> list of matching IOC dictionaries with their
+                event context; observables without a match are omitted
+        """
+        self.refresh()
+        forms = self._canonical_batch(values, attribute_types)
+        candidates = self._bloom_candidates(list(forms))
+        type_filter, type_params = type_condition(attribute_types)
+
+        matches = {}
+        for chunk in chunked(candidates, self.chunk_size):
+            query = 'SELECT * FROM misp_iocs WHERE canonical_value IN ({}){}'.format(
+                ','.join('?' * len(chunk)), type_filter)
+            for row in self.connection.execute(query, chunk + type_params):
+                canonical = row['canonical_value']
+                for value in forms[canonical]:
+                    if canonicalize_value(row['attribute_type'], value) == canonical:
+                        matches.setdefault(value, []).append(dict(row))
+        return matches
+
+    def contains(self, values, attribute_types=None):
+        """
+        Find which observables of a batch are known IOCs.
+
+        Args:
+            values: Iterable of observable strings
+            attribute_types: Only match IOCs of these MISP attribute types (optional)
+
+        Returns:
+            set: Observables that matched at least one IOC
+        """
+        self.refresh()
+        forms = self._canonical_batch(values, attribute_types)
+        candidates = self._bloom_candidates(list(forms))
+        type_filter, type_params = type_condition(attribute_types)
+
+        found = set()
+        for chunk in chunked(candidates, self.chunk_size):
+            query = ('SELECT DISTINCT canonical_value, attribute_type FROM attributes '
+                     'WHERE canonical_value IN ({}){}').format(','.join('?' * len(chunk)), type_filter)
+            for canonical, attribute_type in self.connection.execute(query, chunk + type_params):
+                found.update(value for value in forms[canonical]
+                             if canonicalize_value(attribute_type, value) == canonical)
+        return found
+
+    def _ip_prefix_lengths(self):
+        """Prefix lengths in ip_networks per IP version, longest first."""
+        generation = self._generation()
+        if generation is None or generation != self._ip_prefixes[0]:
+            prefixes = {}
+            for version, prefix_length in self.connection.execute(
+                    'SELECT DISTINCT ip_version, prefix_length FROM ip_networks'):
+                prefixes.setdefault(version, []).append(prefix_length)
+            for lengths in prefixes.values():
+                lengths.sort(reverse=True)
+            self._ip_prefixes = (generation, prefixes)
+        return self._ip_prefixes[1]
+
+    def match_ips(self, addresses, attribute_types=None):
+        """
+        Find the cached IP IOCs whose address, network or range contains
+        each observed address.
+
+        Every candidate network of an address (one per prefix length
+        present in the cache) is resolved in a single query over the
+        ip_networks primary key, so no IOCs are scanned.
+
+        Args:
+            addresses: Iterable of IPv4 or IPv6 address strings
+            attribute_types: Only match IOCs of these MISP attribute types (optional)
+
+        Returns:
+            dict: Address -> list of matching IOC dictionaries, longest
+                prefix first, each with the prefix_length it matched on;
+                addresses without a match are omitted
+        """
+        self.refresh()
+        prefixes = self._ip_prefix_lengths()
+        type_filter, type_params = type_condition(attribute_types)
+
+        matches = {}
+        for address in dict.fromkeys(addresses):
+            try:
+                ip = ipaddress.ip_address(canonicalize_ip(address).strip('[]'))
+            except (AttributeError, ValueError):
+                continue
+            if ip.version == 6 and ip.ipv4_mapped is not None:
+                ip = ip.ipv4_mapped
+            lengths = prefixes.get(ip.version)
+            if not lengths:
+                continue
+            bits = ip.max_prefixlen
+            number = int(ip)
+            params = []
+            for prefix_length in lengths:
+                host_bits = bits - prefix_length
+                params.extend((ip.version, prefix_length, (number >> host_bits << host_bits).to_bytes(bits // 8, 'big')))
+            condition = ' OR '.join(['(n.ip_version = ? AND n.prefix_length = ? AND n.network = ?)'] * len(lengths))
+            query = ('SELECT n.prefix_length, m.* FROM ip_networks n '
+                     'JOIN misp_iocs m ON m.attribute_id = n.attribute_id '
+                     'WHERE ({}){} ORDER BY n.prefix_length DESC').format(condition, type_filter)
+            rows = [dict(row) for row in self.connection.execute(query, params + type_params)]
+            if rows:
+                matches[address] = rows
+        return matches
+
+    def match_ip(self, address, attribute_types=None):
+        """
+        Find the cached IP IOCs containing a single address.
+
+        Args:
+            address: IPv4 or IPv6 address string
+            attribute_types: Only match IOCs of these MISP attribute types (optional)
+
+        Returns:
+            list: Matching IOC dictionaries, longest prefix first
+        """
+        return self.match_ips([address], attribute_types).get(address, [])
+
+    def match_domains(self, hostnames, attribute_types=None):
+        """
+        Find the cached domain and hostname IOCs equal to each hostname or
+        to one of its parent domains.
+
+        All suffixes of a hostname are looked up in one IN (...) probe over
+        the domain_names primary key, which holds the IOC names with their
+        labels reversed.
+
+        Args:
+            hostnames: Iterable of hostnames
+            attribute_types: Only match IOCs of these MISP attribute types (optional)
+
+        Returns:
+            dict: Hostname -> list of matching IOC dictionaries, most
+                specific first, each with the matched_domain it matched on;
+                hostnames without a match are omitted
+        """
+        self.refresh()
+        type_filter, type_params = type_condition(attribute_types)
+
+        matches = {}
+        for hostname in dict.fromkeys(hostnames):
+            reversed_name = reverse_domain(canonicalize_domain(hostname)) if hostname else None
+            if reversed_name is None:
+                continue
+            suffixes = [reversed_name[:i + 1] for i, char in enumerate(reversed_name) if char == '.']
+            query = ('SELECT d.reversed_name, m.* FROM domain_names d '
+                     'JOIN misp_iocs m ON m.attribute_id = d.attribute_id '
+                     'WHERE d.reversed_name IN ({}){} '
+                     'ORDER BY length(d.reversed_name) DESC').format(','.join('?' * len(suffixes)), type_filter)
+            rows = []
+            for row in self.connection.execute(query, suffixes + type_params):
+                ioc = dict(row)
+                ioc['matched_domain'] = reverse_domain(ioc.pop('reversed_name'))[:-1]
+                rows.append(ioc)
+            if rows:
+                matches[hostname] = rows
+        return matches
+
+    def match_hashes(self, hashes):
+        """
+        Find the cached md5, sha1 and sha256 IOCs matching a batch of hashes.
+
+        Each hash is decoded to its binary digest and routed by length to
+        the hash_md5, hash_sha1 or hash_sha256 table, where it is resolved
+        with an IN (...) probe of the short digest primary key. Composite
+        attributes such as filename|md5 are matched on their hash part.
+
+        Args:
+            hashes: Iterable of hex digest strings
+
+        Returns:
+            dict: Hash -> list of matching IOC dictionaries; hashes without
+                a match are omitted
+        """
+        self.refresh()
+        tables = {size: table for table, size in HASH_TABLES.values()}
+        digests = {}
+        for value in dict.fromkeys(hashes):
+            try:
+                digest = bytes.fromhex(value.strip())
+            except (AttributeError, ValueError):
+                continue
+            table = tables.get(len(digest))
+            if table is not None:
+                digests.setdefault(table, {}).setdefault(digest, []).append(value)
+
+        matches = {}
+        for table, values in digests.items():
+            for chunk in chunked(list(values), self.chunk_size):
+                query = ('SELECT h.digest, m.* FROM {} h '
+                         'JOIN misp_iocs m ON m.attribute_id = h.attribute_id '
+                         'WHERE h.digest IN ({})').format(table, ','.join('?' * len(chunk)))
+                for row in self.connection.execute(query, chunk):
+                    ioc = dict(row)
+                    for value in values[ioc.pop('digest')]:
+                        matches.setdefault(value, []).append(ioc)
+        return matches
+
+    def get_contents(self, attribute_ids):
+        """
+        Load the rule bodies of snort, yara and sigma IOCs.
+
+        The cache keeps only a sha256 digest of these values in
+        attribute_value, so the bodies are read from attribute_content on
+        demand.
+
+        Args:
+            attribute_ids: Iterable of attribute ids
+
+        Returns:
+            dict: Attribute id -> rule body; ids without stored content are
+                omitted
+        """
+        self.refresh()
+        contents = {}
+        for chunk in chunked(list(dict.fromkeys(attribute_ids)), self.chunk_size):
+            query = ('SELECT attribute_id, compression, content FROM attribute_content '
+                     'WHERE attribute_id IN ({})').format(','.join('?' * len(chunk)))
+            for attribute_id, compression, content in self.connection.execute(query, chunk):
+                contents[attribute_id] = decompress_content(compression, content)
+        return contents
+
+    def get_content(self, attribute_id):
+        """
+        Load the rule body of a single snort, yara or sigma IOC.
+
+        Args:
+            attribute_id: Attribute id
+
+        Returns:
+            str: Rule body, or None if the attribute has no stored content
+        """
+        return self.get_contents([attribute_id]).get(attribute_id)
+
+    def match_domain(self, hostname, attribute_types=None):
+        """
+        Find the cached domain and hostname IOCs matching a single hostname.
+
+        Args:
+            hostname: Hostname
+            attribute_types: Only match IOCs of these MISP attribute types (optional)
+
+        Returns:
+            list: Matching IOC dictionaries, most specific first
+        """
+        return self.match_domains([hostname], attribute_types).get(hostname, [])
+
+
+def read_cache_generation(connection, db_path):
+    """
+    Identify the generation of the cache a connection is reading.
+
+    Combines the file identity, which changes when the extractor swaps in
+    a rebuilt cache, with the cache_generation row the extractor rewrites
+    on every update.
+
+    Args:
+        connection: Connection to the cache database
+        db_path: Path to the SQLite database file
+
+    Returns:
+        tuple: Opaque value that changes with every cache update
+    """
+    stat = os.stat(db_path)
+    row = connection.execute(
+        "SELECT value FROM extractor_state WHERE key = 'cache_generation'").fetchone()
+    return (stat.st_dev, stat.st_ino, row[0] if row else None)
+
+
+class IOCIndex:
+    """
+    Memory-resident hash index of the IOC values in the cache.
+
+    Canonical values are held in dictionaries per attribute type mapping
+    each value to its attribute ids, so lookups are O(1) with no database
+    round-trip. An observable is canonicalised with the rule of each
+    attribute type before it is looked up.
+    The index follows the extractor: refresh() rebuilds it when the cache
+    generation changed and swaps the new dictionaries in with a single
+    assignment, so concurrent lookups see either the old or the new index.
+    """
+
+    def __init__(self, db_path=None, attribute_types=None):
+        """
+        Args:
+            db_path: Path to the SQLite database file (None will use ioc_cache.db
+                next to this module)
+            attribute_types: Only index IOCs of these MISP attribute types (optional)
+        """
+        if db_path is None:
+            db_path = os.path.join(SCRIPT_DIR, 'ioc_cache.db')
+        self.db_path = db_path
+        self.attribute_types = list(attribute_types) if attribute_types else None
+        # (values by type, types grouped by canonicalisation rule, generation)
+        self._snapshot = ({}, {}, None)
+        self._refresh_lock = threading.Lock()
+        self._stop_refresh = None
+        self.reload()
+
+    @property
+    def generation(self):
+        """Generation of the cache the index was built from."""
+        return self._snapshot[2]
+
+    def reload(self):
+        """
+        Rebuild the index from the cache database and swap it in.
+
+        Returns:
+            int: Number of IOCs indexed
+        """
+        with self._refresh_lock:
+            return self._build()
+
+    def _build(self):
+        by_type = {}
+        connection = open_cache_db(self.db_path)
+        try:
+            # Read the generation and the rows from the same snapshot
+            connection.execute('BEGIN')
+            generation = read_cache_generation(connection, self.db_path)
+            type_filter, type_params = type_condition(self.attribute_types)
+            query = 'SELECT attribute_type, canonical_value, attribute_id FROM attributes WHERE 1 = 1' + type_filter
+            count = 0
+            for attribute_type, value, attribute_id in connection.execute(query, type_params):
+                values = by_type.get(attribute_type)
+                if values is None:
+                    values = by_type[attribute_type] = {}
+                values[value] = values.get(value, ()) + (attribute_id,)
+                count += 1
+            connection.execute('COMMIT')
+        finally:
+            connection.close()
+        rule_types = {}
+        for attribute_type in by_type:
+            rule_types.setdefault(canonical_rule(attribute_type), []).append(attribute_type)
+        self._snapshot = (by_type, rule_types, generation)
+        logger.info(f"Loaded {count} IOCs into memory from {self.db_path}")
+        return count
+
+    def refresh(self):
+        """
+        Rebuild the index if the extractor updated the cache since it was built.
+
+        Returns:
+            bool: True if the index was rebuilt
+        """
+        with self._refresh_lock:
+            try:
+                connection = open_cache_db(self.db_path)
+                try:
+                    generation = read_cache_generation(connection, self.db_path)
+                finally:
+                    connection.close()
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Could not check IOC cache generation: {e}")
+                return False
+            if generation == self.generation:
+                return False
+            self._build()
+            return True
+
+    def start_auto_refresh(self, interval=30):
+        """
+        Check for a new cache generation in a background thread.
+
+        Args:
+            interval: Seconds between checks
+        """
+        if self._stop_refresh is not None:
+            return
+        self._stop_refresh = threading.Event()
+        stop = self._stop_refresh
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"Error refreshing IOC index: {e}")
+
+        threading.Thread(target=run, name='ioc-index-refresh', daemon=True).start()
+
+    def stop_auto_refresh(self):
+        """Stop the background refresh thread."""
+        if self._stop_refresh is not None:
+            self._stop_refresh.set()
+            self._stop_refresh = None
+
+    def __len__(self):
+        return sum(len(values) for values in self._snapshot[0].values())
+
+    def lookup(self, value, attribute_type=None):
+        """
+        Find the attribute ids of the IOCs with a given value.
+
+        Args:
+            value: Observable string
+            attribute_type: Only match IOCs of this MISP attribute type (optional)
+
+        Returns:
+            tuple: Attribute ids, empty if the value is not an IOC
+        """
+        by_type, rule_types, _ = self._snapshot
+        if attribute_type is not None:
+            return by_type.get(attribute_type, {}).get(canonicalize_value(attribute_type, value), ())
+        attribute_ids = ()
+        for rule, attribute_types in rule_types.items():
+            canonical = rule(value)
+            for attribute_type in attribute_types:
+                attribute_ids += by_type[attribute_type].get(canonical, ())
+        return attribute_ids
+
+    def contains(self, value, attribute_type=None):
+        """
+        Check whether a value is a known IOC.
+
+        Args:
+            value: Observable string
+            attribute_type: Only match IOCs of this MISP attribute type (optional)
+
+        Returns:
+            bool: True if the value matched at least one IOC
+        """
+        by_type, rule_types, _ = self._snapshot
+        if attribute_type is not None:
+            return canonicalize_value(attribute_type, value) in by_type.get(attribute_type, ())
+        for rule, attribute_types in rule_types.items():
+            canonical = rule(value)
+            for attribute_type in attribute_types:
+                if canonical in by_type[attribute_type]:
+                    return True
+        return False
@@ -4,16 +4,27 @@ MISP Database IOC Extractor
 
 This script connects to a locally running MISP MySQL/MariaDB database and extracts
 IOCs (Indicators of Compromise) from the last 24 hours. It's designed to be run
-as a daily cron job to cache recently added/updated threat indicators.
+as a daily cron job to cache recently added/updated threat indicators, or as a
+daemon that extracts incremental changes every few seconds.
 
 The script outputs a list of dictionaries containing IOC data which can be
 used for further processing or converted to JSON for downstream applications.
 
 Usage:
-    python misp_db_extractor.py [config_file]
+    python misp_db_extractor.py [--config CONFIG] [--resume-after-id ID]
+    python misp_db_extractor.py --daemon [--interval SECONDS]
+    python misp_db_extractor.py --binlog
+    python misp_db_extractor.py --replay-binlog FILE
 
-    If config_file is not provided, the script will look for misp_db_config.json
-    in the same directory.
+    If no configuration file is given, the script will look for
+    misp_db_config.json in the same directory.
+
+The module can also be imported without side effects: the configuration,
+log file and MySQL driver are only loaded when an extraction runs.
+
+    from misp_db_extractor import Extractor
+
+    Extractor(config_path='misp_db_config.json').run()
 
 Requirements:
     - MySQL Connector for Python: pip install mysql-connector-python
@@ -25,26 +36,46 @@ import sys
 import logging
 import json
 import datetime
-import argparse
-import mysql.connector
-from mysql.connector import Error
-import shutil  # Added for file operations
+import functools
+import itertools
+import operator
+import queue
+import threading
+import time
 
 # Set up the script directory
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Configure logging
+# Log file written when the extractor runs from the command line
 LOG_FILE = os.path.join(SCRIPT_DIR, 'misp_db_extractor.log')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger('misp_db_extractor')
 
+# Default configuration of the extraction and output functions called
+# without one; loaded from misp_db_config.json on first use unless
+# set_config was called first
+_config = None
+
+
+def configure_logging(log_file=None):
+    """
+    Send log messages to the console and a log file.
+    
+    Only called by the command line entry point, so importing the module
+    never opens the log file.
+    
+    Args:
+        log_file: Path to the log file (None will use LOG_FILE)
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_file or LOG_FILE),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+
+
 def load_config(config_path=None):
     """
     Load configuration from JSON file
@@ -76,6 +107,17 @@ def load_config(config_path=None):
             },
             "extraction": {
                 "hours_lookback": 24,
+                "batch_size": 5000,
+                "mode": "window",
+                "page_size": 10000,
+                "page_pause_seconds": 0,
+                "incremental_overlap_seconds": 60,
+                "parallelism": 1,
+                "published_only": False,
+                "to_ids_only": False,
+                "skip_disable_correlation": False,
+                "enrichment": True,
+                "enrichment_batch_size": 5000,
                 "ioc_types": [
                     "ip-src", "ip-dst", "domain", "hostname", "url", 
                     "md5", "sha1", "sha256", "filename", "email-src", 
@@ -84,35 +126,85 @@ def load_config(config_path=None):
             },
             "output": {
                 "json_file": "misp_recent_iocs.json",
+                "json_format": "json",
+                "json_compact": False,
+                "json_serializer": "auto",
                 "cache_db": "ioc_cache.db",
-                "backup_db": "ioc_cache_yesterday.db"  # Added backup db name
+                "backup_db": "ioc_cache_yesterday.db",  # Added backup db name
+                "cache_mode": "rebuild",
+                "retention_hours": 24,
+                "insert_chunk_size": 10000,
+                "bloom_filter": "ioc_cache.bloom",
+                "bloom_fp_rate": 0.001,
+                "pattern_file": "ioc_patterns.bin",
+                "pattern_min_length": 4,
+                "content_compression": "zlib",
+                "parquet_file": None,
+                "parquet_row_group_size": 100000,
+                "parquet_compression": "zstd"
+            },
+            "daemon": {
+                "interval_seconds": 60,
+                "sidecar_interval_seconds": 0,
+                "stats_file": "extractor_stats.json"
+            },
+            "binlog": {
+                "server_id": 4711,
+                "heartbeat_seconds": 1,
+                "batch_size": 1000,
+                "flush_seconds": 1,
+                "sidecar_interval_seconds": 60,
+                "retry_seconds": 10,
+                "record_file": None
             }
         }
 
-# Parse command line arguments
-parser = argparse.ArgumentParser(description='Extract IOCs from MISP database')
-parser.add_argument('--config', help='Path to configuration file')
-args = parser.parse_args()
 
-# Load configuration
-config = load_config(args.config)
+def get_config():
+    """
+    Get the default configuration, loading the default file on first use.
+    
+    Functions called without a config argument use it.
+    
+    Returns:
+        dict: Configuration dictionary
+    """
+    global _config
+    if _config is None:
+        _config = load_config()
+    return _config
+
 
-# Database connection configuration
-DB_CONFIG = config['database']
+def set_config(config):
+    """
+    Make a configuration dictionary the default configuration.
+    
+    Args:
+        config: Configuration dictionary, as returned by load_config
+    """
+    global _config
+    _config = config
 
-# IOC Types to extract (MISP attribute types)
-IOC_TYPES = config['extraction']['ioc_types']
 
-def connect_to_db():
+def connect_to_db(config=None):
     """
     Establish a connection to the MISP database.
     
+    Args:
+        config: Configuration dictionary (None will use get_config())
+        
     Returns:
         connection: MySQL connection object or None if connection fails
     """
+    import mysql.connector
+    from mysql.connector import Error
+    
+    if config is None:
+        config = get_config()
+    
     try:
         logger.info("Connecting to MISP database...")
-        connection = mysql.connector.connect(**DB_CONFIG)
+        connection = mysql.connector.connect(**config['database'])
         if connection.is_connected():
             logger.info(f"Successfully connected to MISP database (MySQL version: {connection.server_info})")
             return connection
@@ -121,37 +213,34 @@ def connect_to_db():
         return None
 
 
-def fetch_recent_iocs(connection, hours=None):
+def create_connection_pool(size, config=None):
     """
-    Fetch IOCs from the MISP database that were created or updated 
-    in the last specified number of hours.
+    Create a pool of connections to the MISP database.
     
     Args:
-        connection: MySQL connection object
-        hours: Number of hours to look back (None will use config value)
+        size: Number of connections in the pool
+        config: Configuration dictionary (None will use get_config())
         
     Returns:
-        list: List of dictionaries containing IOC data
+        MySQLConnectionPool: Connection pool or None if connection fails
     """
-    if hours is None:
-        hours = config['extraction']['hours_lookback']
-    iocs = []
-    cursor = None
+    import mysql.connector.pooling
+    from mysql.connector import Error
+    
+    if config is None:
+        config = get_config()
     
     try:
-        if not connection or not connection.is_connected():
-            logger.error("Database connection is not established")
-            return iocs
-            
-        cursor = connection.cursor(dictionary=True)
-        
-        # Calculate timestamp for the lookback period
-        lookback_time = datetime.datetime.now() - datetime.timedelta(hours=hours)
-        timestamp = lookback_time.strftime("%Y-%m-%d %H:%M:%S")
-        
-        # SQL query to fetch recent IOCs
-        # This query joins the events and attributes tables to get comprehensive IOC data
-        query = """
+        logger.info(f"Creating pool of {size} connections to MISP database...")
+        return mysql.connector.pooling.MySQLConnectionPool(
+            pool_name='misp_db_extractor', pool_size=size, **config['database'])
+    except Error as e:
+        logger.error(f"Error connecting to MISP database: {e}")
+        return None
+
+
+# Columns selected for every IOC row; shared by all extraction queries
+IOC_QUERY = """
         SELECT 
             e.id as event_id,
             e.uuid as event_uuid,
@@ -164,217 +253,3067 @@ def fetch_recent_iocs(connection, hours=None):
             a.value1 as attribute_value,
             a.timestamp as attribute_timestamp,
             a.comment as attribute_comment,
-            a.to_ids as attribute_to_ids
+            a.to_ids as attribute_to_ids,
+            a.deleted as attribute_deleted,
+            a.disable_correlation as attribute_disable_correlation,
+            e.published as event_published
         FROM 
             events e
         JOIN 
             attributes a ON e.id = a.event_id
+        """
+
+
+def format_ioc_row(row):
+    """
+    Convert the epoch timestamps of a raw IOC row to a readable format.
+    
+    Timestamps that are already formatted are left alone.
+    
+    Args:
+        row: Dictionary as returned by the MySQL cursor
+        
+    Returns:
+        dict: The same dictionary with formatted timestamps
+    """
+    if isinstance(row.get('event_timestamp'), int) and row['event_timestamp']:
+        event_dt = datetime.datetime.fromtimestamp(row['event_timestamp'])
+        row['event_timestamp'] = event_dt.strftime("%Y-%m-%d %H:%M:%S")
+        
+    if isinstance(row.get('attribute_timestamp'), int) and row['attribute_timestamp']:
+        attr_dt = datetime.datetime.fromtimestamp(row['attribute_timestamp'])
+        row['attribute_timestamp'] = attr_dt.strftime("%Y-%m-%d %H:%M:%S")
+        
+    return row
+
+
+def ioc_row_converter(config=None):
+    """
+    Build the function that turns raw IOC rows into IOCs or tombstones.
+    
+    Soft-deleted attributes, and depending on the extraction.published_only,
+    extraction.to_ids_only and extraction.skip_disable_correlation
+    settings attributes of unpublished events, attributes with to_ids off
+    and attributes with correlation disabled, are not extracted. They are
+    returned as tombstones instead, so an incremental cache that still
+    holds them deletes them. A tombstone is a dictionary with
+    attribute_id, event_id and tombstone set to True; an attribute_id of
+    None stands for every attribute of the event.
+    
+    Args:
+        config: Configuration dictionary (None will use get_config())
+        
+    Returns:
+        function: Taking a row as returned by the MySQL cursor for
+            IOC_QUERY and returning the formatted IOC or a tombstone
+    """
+    if config is None:
+        config = get_config()
+    
+    published_only = config['extraction'].get('published_only', False)
+    to_ids_only = config['extraction'].get('to_ids_only', False)
+    skip_disable_correlation = config['extraction'].get('skip_disable_correlation', False)
+    
+    def convert(row):
+        deleted = row.pop('attribute_deleted')
+        disable_correlation = row.pop('attribute_disable_correlation')
+        published = row.pop('event_published')
+        if (deleted or (published_only and not published) or (to_ids_only and not row['attribute_to_ids'])
+                or (skip_disable_correlation and disable_correlation)):
+            return {'attribute_id': row['attribute_id'], 'event_id': row['event_id'], 'tombstone': True}
+        return format_ioc_row(row)
+    
+    return convert
+
+
+def lookback_timestamp(hours):
+    """
+    Calculate the MISP timestamp marking the start of a lookback window.
+    
+    MISP stores event and attribute timestamps as Unix epoch integers,
+    so the cutoff must be compared as one too.
+    
+    Args:
+        hours: Number of hours to look back
+        
+    Returns:
+        int: Unix timestamp of the start of the window
+    """
+    lookback_time = datetime.datetime.now() - datetime.timedelta(hours=hours)
+    return int(lookback_time.timestamp())
+
+
+def iter_recent_iocs(connection, hours=None, batch_size=None, ioc_types=None, config=None):
+    """
+    Stream IOCs from the MISP database that were created or updated 
+    in the last specified number of hours.
+    
+    Rows are read through an unbuffered cursor and pulled from the server
+    with fetchmany, so only one batch is held in memory at a time no
+    matter how large the lookback window is. A database error raises
+    even after rows were yielded, so an incomplete window never replaces
+    the cache or the JSON file.
+    
+    Args:
+        connection: MySQL connection object
+        hours: Number of hours to look back (None will use config value)
+        batch_size: Number of rows per fetchmany call (None will use config value)
+        ioc_types: Attribute types to extract (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+        
+    Yields:
+        dict: IOC data for a single attribute, or a tombstone, see
+            ioc_row_converter
+    """
+    from mysql.connector import Error
+    if config is None:
+        config = get_config()
+    
+    if hours is None:
+        hours = config['extraction']['hours_lookback']
+    if batch_size is None:
+        batch_size = config['extraction'].get('batch_size', 5000)
+    if ioc_types is None:
+        ioc_types = config['extraction']['ioc_types']
+    convert = ioc_row_converter(config)
+    cursor = None
+    count = 0
+    
+    try:
+        if not connection or not connection.is_connected():
+            logger.error("Database connection is not established")
+            return
+            
+        # Unbuffered cursor: the result set stays on the server and is
+        # transferred as we fetch it instead of being loaded up front
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        
+        # Calculate timestamp for the lookback period
+        timestamp = lookback_timestamp(hours)
+        
+        # SQL query to fetch recent IOCs
+        # This query joins the events and attributes tables to get comprehensive IOC data
+        query = IOC_QUERY + """
         WHERE 
             a.type IN ({})
             AND (a.timestamp >= %s OR e.timestamp >= %s)
         ORDER BY 
             a.timestamp DESC
-        """.format(','.join(['%s'] * len(IOC_TYPES)))
+        """.format(','.join(['%s'] * len(ioc_types)))
         
         # Execute the query with parameters
-        params = IOC_TYPES + [timestamp, timestamp]
+        params = list(ioc_types) + [timestamp, timestamp]
         cursor.execute(query, params)
         
-        # Fetch and process results
-        for row in cursor:
-            # Convert timestamps to readable format
-            if 'event_timestamp' in row and row['event_timestamp']:
-                event_dt = datetime.datetime.fromtimestamp(row['event_timestamp'])
-                row['event_timestamp'] = event_dt.strftime("%Y-%m-%d %H:%M:%S")
-                
-            if 'attribute_timestamp' in row and row['attribute_timestamp']:
-                attr_dt = datetime.datetime.fromtimestamp(row['attribute_timestamp'])
-                row['attribute_timestamp'] = attr_dt.strftime("%Y-%m-%d %H:%M:%S")
-                
-            iocs.append(row)
+        # Fetch and process results batch by batch
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                count += 1
+                yield convert(row)
             
-        logger.info(f"Retrieved {len(iocs)} IOCs from the past {hours} hours")
+        logger.info(f"Retrieved {count} IOCs from the past {hours} hours")
         
     except Error as e:
         logger.error(f"Error querying MISP database: {e}")
+        raise
     finally:
         if cursor:
-            cursor.close()
-            
-    return iocs
+            try:
+                cursor.close()
+            except Error:
+                # The consumer stopped early; drain the unread rows so the
+                # connection can be reused
+                connection.consume_results()
 
 
-def save_to_json(iocs, output_file=None):
+def iter_iocs_paginated(connection, hours=None, page_size=None, after_id=None, page_pause=None,
+                        ioc_types=None, keep_partial=False, config=None):
     """
-    Save the IOCs to a JSON file.
+    Stream IOCs from the lookback window in pages keyed on attributes.id.
+    
+    Each page is a short query of the form ``a.id > last_id ORDER BY a.id
+    LIMIT page_size``, which MySQL answers with a range scan on the primary
+    key instead of sorting the whole window. The read transaction is ended
+    after every page so no long-lived snapshot is held on the MISP database,
+    and the walk can be paused between pages or resumed from a known id.
+    
+    A database error part way through the walk is raised, so a cache that
+    is rebuilt from the walk is never replaced by a partial one. Only a
+    cache that is updated in place can keep the rows read before the
+    error and be completed by resuming after the last logged id.
     
     Args:
-        iocs: List of IOC dictionaries
-        output_file: File path for the JSON output (None will use config value)
+        connection: MySQL connection object
+        hours: Number of hours to look back (None will use config value)
+        page_size: Number of rows per page (None will use config value)
+        after_id: Resume after this attribute id (None will use config value)
+        page_pause: Seconds to sleep between pages (None will use config value)
+        ioc_types: Attribute types to extract (None will use config value)
+        keep_partial: End the walk at a database error instead of raising it
+        config: Configuration dictionary (None will use get_config())
+        
+    Yields:
+        dict: IOC data for a single attribute, or a tombstone, see
+            ioc_row_converter
     """
-    if output_file is None:
-        output_file = os.path.join(SCRIPT_DIR, config['output']['json_file'])
+    from mysql.connector import Error
+    if config is None:
+        config = get_config()
+    
+    if hours is None:
+        hours = config['extraction']['hours_lookback']
+    if page_size is None:
+        page_size = config['extraction'].get('page_size', 10000)
+    if after_id is None:
+        after_id = config['extraction'].get('start_after_id', 0)
+    if page_pause is None:
+        page_pause = config['extraction'].get('page_pause_seconds', 0)
+    if ioc_types is None:
+        ioc_types = config['extraction']['ioc_types']
+    convert = ioc_row_converter(config)
+    cursor = None
+    count = 0
+    last_id = after_id
+    
     try:
-        with open(output_file, 'w') as f:
-            json.dump(iocs, f, indent=4)
-        logger.info(f"Successfully saved {len(iocs)} IOCs to {output_file}")
-    except Exception as e:
-        logger.error(f"Error saving IOCs to file {output_file}: {e}")
+        if not connection or not connection.is_connected():
+            logger.error("Database connection is not established")
+            return
+            
+        cursor = connection.cursor(dictionary=True)
+        timestamp = lookback_timestamp(hours)
+        
+        query = IOC_QUERY + """
+        WHERE 
+            a.id > %s
+            AND a.type IN ({})
+            AND (a.timestamp >= %s OR e.timestamp >= %s)
+        ORDER BY 
+            a.id
+        LIMIT %s
+        """.format(','.join(['%s'] * len(ioc_types)))
+        
+        while True:
+            cursor.execute(query, [last_id] + list(ioc_types) + [timestamp, timestamp, page_size])
+            rows = cursor.fetchall()
+            # End the read transaction so MISP is not kept on an old snapshot
+            connection.commit()
+            if not rows:
+                break
+            
+            last_id = rows[-1]['attribute_id']
+            for row in rows:
+                count += 1
+                yield convert(row)
+            logger.info(f"Fetched page of {len(rows)} IOCs up to attribute id {last_id}")
+            
+            if len(rows) < page_size:
+                break
+            if page_pause:
+                time.sleep(page_pause)
+            
+        logger.info(f"Retrieved {count} IOCs from the past {hours} hours")
+        
+    except Error as e:
+        logger.error(f"Error querying MISP database: {e}")
+        if not keep_partial:
+            raise
+        logger.error(f"Extraction can be resumed after attribute id {last_id}")
+    finally:
+        if cursor:
+            cursor.close()
 
 
-def backup_cache_db(db_path, backup_path=None):
+def iter_iocs_incremental(connection, watermark=None, page_size=None, state=None, ioc_types=None, config=None):
     """
-    Create a backup of the existing cache database.
+    Stream IOCs changed since the last extraction.
     
-    Args:
-        db_path: Path to the current SQLite database file
-        backup_path: Path where backup will be saved (None will use config value)
+    Attributes are walked in (a.timestamp, a.id) order starting just after
+    the watermark, in pages keyed on that pair. The watermark is moved back
+    by extraction.incremental_overlap_seconds so rows committed late by MISP
+    with an older timestamp are picked up again on the next run. Attributes
+    that are no longer extracted, such as soft-deleted ones, are yielded as
+    tombstones.
     
-    Returns:
-        bool: True if backup was successful or not needed, False if it failed
+    Args:
+        connection: MySQL connection object
+        watermark: Tuple of (attribute timestamp, attribute id) of the last
+            extracted row, or None to start at the lookback window
+        page_size: Number of rows per page (None will use config value)
+        state: Dictionary that receives the new watermark once every row
+            has been read; it is left untouched if extraction fails
+        ioc_types: Attribute types to extract (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+        
+    Yields:
+        dict: IOC data for a single attribute, or a tombstone, see
+            ioc_row_converter
     """
-    if backup_path is None:
-        backup_path = os.path.join(SCRIPT_DIR, config['output'].get('backup_db', 'ioc_cache_yesterday.db'))
+    from mysql.connector import Error
+    if config is None:
+        config = get_config()
+    
+    if page_size is None:
+        page_size = config['extraction'].get('page_size', 10000)
+    if watermark is None:
+        last_timestamp = lookback_timestamp(config['extraction']['hours_lookback'])
+        last_id = 0
+    else:
+        overlap = config['extraction'].get('incremental_overlap_seconds', 60)
+        last_timestamp, last_id = watermark
+        if overlap:
+            last_timestamp, last_id = last_timestamp - overlap, 0
+    if ioc_types is None:
+        ioc_types = config['extraction']['ioc_types']
+    convert = ioc_row_converter(config)
+    cursor = None
+    count = 0
     
     try:
-        # Check if the current cache exists
-        if os.path.exists(db_path):
-            # Backup the existing file
-            shutil.copy2(db_path, backup_path)
-            logger.info(f"Created backup of IOC cache at {backup_path}")
+        if not connection or not connection.is_connected():
+            logger.error("Database connection is not established")
+            return
             
-            # Remove the current file to start fresh
-            os.remove(db_path)
-            logger.info(f"Removed old IOC cache at {db_path} to create fresh database")
-        else:
-            logger.info(f"No existing IOC cache found at {db_path}, no backup needed")
-        return True
-    except Exception as e:
-        logger.error(f"Error backing up cache database: {e}")
-        return False
+        cursor = connection.cursor(dictionary=True)
+        logger.info(f"Fetching IOCs changed after timestamp {last_timestamp}, attribute id {last_id}")
+        since = last_timestamp
+        
+        query = IOC_QUERY + """
+        WHERE 
+            a.type IN ({})
+            AND (a.timestamp > %s OR (a.timestamp = %s AND a.id > %s))
+        ORDER BY 
+            a.timestamp, a.id
+        LIMIT %s
+        """.format(','.join(['%s'] * len(ioc_types)))
+        
+        while True:
+            cursor.execute(query, list(ioc_types) + [last_timestamp, last_timestamp, last_id, page_size])
+            rows = cursor.fetchall()
+            # End the read transaction so MISP is not kept on an old snapshot
+            connection.commit()
+            if not rows:
+                break
+            
+            last_timestamp = rows[-1]['attribute_timestamp']
+            last_id = rows[-1]['attribute_id']
+            for row in rows:
+                count += 1
+                yield convert(row)
+            
+            if len(rows) < page_size:
+                break
+        
+        # Publishing an event leaves the timestamps of its attributes alone,
+        # so with published_only the events are followed as well: the IOCs
+        # of newly published events are fetched, and unpublished events
+        # become tombstones
+        if config['extraction'].get('published_only', False):
+            cursor.execute(
+                'SELECT id, published, publish_timestamp FROM events WHERE timestamp > %s OR publish_timestamp > %s',
+                [since, since])
+            events = cursor.fetchall()
+            connection.commit()
+            published_ids = []
+            for event in events:
+                if not event['published']:
+                    count += 1
+                    yield {'attribute_id': None, 'event_id': event['id'], 'tombstone': True}
+                elif event['publish_timestamp'] > since:
+                    published_ids.append(event['id'])
+            
+            # Attributes changed after since were fetched above
+            for start in range(0, len(published_ids), ID_CHUNK_SIZE):
+                chunk = published_ids[start:start + ID_CHUNK_SIZE]
+                cursor.execute(IOC_QUERY + """
+                WHERE
+                    a.type IN ({})
+                    AND a.event_id IN ({})
+                    AND a.timestamp < %s
+                """.format(','.join(['%s'] * len(ioc_types)), ','.join(['%s'] * len(chunk))),
+                    list(ioc_types) + chunk + [since])
+                rows = cursor.fetchall()
+                connection.commit()
+                for row in rows:
+                    count += 1
+                    yield convert(row)
+            
+        logger.info(f"Retrieved {count} IOCs changed since the last run")
+        if state is not None:
+            state['watermark_timestamp'] = last_timestamp
+            state['watermark_attribute_id'] = last_id
+        
+    except Error as e:
+        logger.error(f"Error querying MISP database: {e}")
+    finally:
+        if cursor:
+            cursor.close()
 
 
-def save_to_cache_db(iocs, db_path=None):
+def load_cache_state(db_path):
     """
-    Save the IOCs to a SQLite cache database.
+    Read the extractor state stored in the cache database.
     
     Args:
-        iocs: List of IOC dictionaries
-        db_path: Path to the SQLite database file (None will use config value)
+        db_path: Path to the SQLite database file
+        
+    Returns:
+        dict: State entries, empty if the cache or state table does not exist
     """
-    if db_path is None:
-        db_path = os.path.join(SCRIPT_DIR, config['output']['cache_db'])
-    
-    # Backup the existing database before proceeding
-    backup_path = os.path.join(SCRIPT_DIR, config['output'].get('backup_db', 'ioc_cache_yesterday.db'))
-    if not backup_cache_db(db_path, backup_path):
-        logger.warning("Proceeding with database update without backup")
-    
+    if not os.path.exists(db_path):
+        return {}
     try:
         import sqlite3
         conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Create table if it doesn't exist
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS misp_iocs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            event_id INTEGER,
-            event_uuid TEXT,
-            event_info TEXT,
-            event_date TEXT,
-            event_timestamp TEXT,
-            attribute_id INTEGER,
-            attribute_type TEXT,
-            attribute_category TEXT,
-            attribute_value TEXT,
-            attribute_timestamp TEXT,
-            attribute_comment TEXT,
-            attribute_to_ids INTEGER,
-            import_time TEXT,
-            executive_summary TEXT
-        )
-        ''')
-        
-        # Create indices for faster lookups
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_attribute_type ON misp_iocs (attribute_type)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_attribute_value ON misp_iocs (attribute_value)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_event_id ON misp_iocs (event_id)')
+        try:
+            return dict(conn.execute('SELECT key, value FROM extractor_state'))
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning(f"Could not read extractor state from {db_path}: {e}")
+        return {}
+
+
+def skip_unchanged_iocs(iocs, db_path, chunk_size=None):
+    """
+    Drop the IOCs that a cache already holds unchanged.
+    
+    An incremental extraction re-reads the rows of its overlap on every
+    run. They are looked up in the cache a chunk at a time and dropped if
+    the attribute and event timestamps match, so a run in which nothing
+    changed writes no output and leaves the cache generation alone.
+    Tombstones are dropped if the cache does not hold their attribute or
+    event.
+    
+    Args:
+        iocs: Iterable of IOC dictionaries
+        db_path: Path to the SQLite cache database
+        chunk_size: Number of IOCs looked up per query (None will use
+            ID_CHUNK_SIZE)
         
-        # Insert IOCs into database
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    Yields:
+        dict: IOC data for a single attribute, or a tombstone
+    """
+    import sqlite3
+    
+    if chunk_size is None:
+        chunk_size = ID_CHUNK_SIZE
+    skipped = 0
+    conn = sqlite3.connect(db_path)
+    try:
+        iocs = iter(iocs)
+        while True:
+            chunk = list(itertools.islice(iocs, chunk_size))
+            if not chunk:
+                break
+            attribute_ids = [ioc['attribute_id'] for ioc in chunk if ioc['attribute_id'] is not None]
+            event_ids = list({ioc['event_id'] for ioc in chunk if ioc['attribute_id'] is None})
+            stored = {row[0]: row[1:] for row in conn.execute(f'''
+                SELECT a.attribute_id, a.attribute_timestamp, e.event_timestamp
+                FROM attributes a JOIN events e ON e.event_id = a.event_id
+                WHERE a.attribute_id IN ({','.join('?' * len(attribute_ids))})
+                ''', attribute_ids)}
+            stored_events = {row[0] for row in conn.execute(
+                f"SELECT event_id FROM events WHERE event_id IN ({','.join('?' * len(event_ids))})", event_ids)}
+            for ioc in chunk:
+                if 'tombstone' in ioc:
+                    keep = (ioc['event_id'] in stored_events if ioc['attribute_id'] is None
+                            else ioc['attribute_id'] in stored)
+                else:
+                    keep = stored.get(ioc['attribute_id']) != (ioc['attribute_timestamp'], ioc['event_timestamp'])
+                if keep:
+                    yield ioc
+                else:
+                    skipped += 1
+    finally:
+        conn.close()
+    logger.info(f"Skipped {skipped} IOCs already stored unchanged in cache database {db_path}")
+
+
+def iter_iocs_parallel(pool, make_shard, parallelism=None, state=None, ioc_types=None, config=None):
+    """
+    Stream IOCs from one shard per attribute type, run concurrently.
+    
+    Each shard runs on its own connection from the pool in a worker thread
+    and hands rows over in batches through a bounded queue, so MySQL
+    evaluates several smaller queries in parallel while memory stays
+    bounded. The shard streams are merged in arrival order. If a shard
+    raises, as window and paginated shards do on a database error, the
+    merged stream raises too, so a cache that is rebuilt from it is not
+    replaced by a partial one. An incremental shard ends early without
+    reporting a watermark instead, so no merged watermark is stored.
+    
+    Args:
+        pool: MySQL connection pool with at least parallelism connections
+        make_shard: Function taking (connection, ioc_types, shard_state)
+            and returning an IOC iterator for those types
+        parallelism: Number of shards run at once (None will use config value)
+        state: Dictionary that receives the lowest shard watermark, only if
+            every shard completed and reported one
+        ioc_types: Attribute types to extract (None will use config value)
+        config: Configuration dictionary (None will use get_config())
         
-        for ioc in iocs:
-            cursor.execute('''
-            INSERT INTO misp_iocs (
-                event_id, event_uuid, event_info, event_date, event_timestamp,
-                attribute_id, attribute_type, attribute_category, attribute_value,
-                attribute_timestamp, attribute_comment, attribute_to_ids, import_time
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                ioc.get('event_id'),
-                ioc.get('event_uuid'),
-                ioc.get('event_info'),
-                ioc.get('event_date'),
-                ioc.get('event_timestamp'),
-                ioc.get('attribute_id'),
-                ioc.get('attribute_type'),
-                ioc.get('attribute_category'),
-                ioc.get('attribute_value'),
-                ioc.get('attribute_timestamp'),
-                ioc.get('attribute_comment'),
-                ioc.get('attribute_to_ids', 0),
-                current_time
-            ))
+    Yields:
+        dict: IOC data for a single attribute
+    """
+    import concurrent.futures
+    
+    if config is None:
+        config = get_config()
+    
+    if parallelism is None:
+        parallelism = config['extraction'].get('parallelism', 1)
+    if ioc_types is None:
+        ioc_types = config['extraction']['ioc_types']
+    batch_size = config['extraction'].get('batch_size', 5000)
+    rows_queue = queue.Queue(maxsize=parallelism * 2)
+    stop = threading.Event()
+    shard_states = [{} for _ in ioc_types]
+    shard_done = object()
+    failed_types = []
+    
+    def put(item):
+        # Give up if the consumer went away instead of blocking forever
+        while not stop.is_set():
+            try:
+                rows_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def run_shard(ioc_type, shard_state):
+        try:
+            connection = pool.get_connection()
+            try:
+                rows = make_shard(connection, [ioc_type], shard_state)
+                try:
+                    for batch in iter(lambda: list(itertools.islice(rows, batch_size)), []):
+                        if not put(batch):
+                            break
+                finally:
+                    rows.close()
+            finally:
+                connection.close()
+        except Exception as e:
+            logger.error(f"Error extracting {ioc_type} IOCs: {e}")
+            shard_state.clear()
+            failed_types.append(ioc_type)
+        finally:
+            put(shard_done)
+    
+    logger.info(f"Extracting {len(ioc_types)} attribute types with {parallelism} parallel connections")
+    if state is not None:
+        # The watermark is compared with MISP timestamps, so the start of
+        # the run is taken from the server clock rather than this host's
+        connection = pool.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SELECT UNIX_TIMESTAMP()')
+            started = int(cursor.fetchone()[0])
+            cursor.close()
+            connection.commit()
+        finally:
+            connection.close()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=parallelism)
+    try:
+        for ioc_type, shard_state in zip(ioc_types, shard_states):
+            executor.submit(run_shard, ioc_type, shard_state)
         
-        conn.commit()
-        logger.info(f"Successfully saved {len(iocs)} IOCs to cache database {db_path}")
+        remaining = len(ioc_types)
+        while remaining:
+            item = rows_queue.get()
+            if item is shard_done:
+                if failed_types:
+                    raise RuntimeError(f"Extraction of {', '.join(failed_types)} IOCs failed")
+                remaining -= 1
+                continue
+            yield from item
         
-    except Exception as e:
-        logger.error(f"Error saving IOCs to cache database {db_path}: {e}")
+        # Shards finish at different times, so a row of a fast shard's type
+        # can be committed below the watermark of a slower one; only the
+        # lowest watermark is safe for every type. Every shard has read the
+        # rows committed before it started, so a shard whose last row is
+        # older, or that found none, is taken to be at the server time the
+        # run started
+        if state is not None and all(shard_states):
+            state['watermark_timestamp'], state['watermark_attribute_id'] = min(
+                max((s['watermark_timestamp'], s['watermark_attribute_id']), (started, 0))
+                for s in shard_states
+            )
     finally:
-        if 'conn' in locals():
-            conn.close()
+        stop.set()
+        executor.shutdown(wait=True)
 
 
-def main():
+def iter_iocs(connection, db_path=None, state=None, pool=None, resume_after_id=None, cache_state=None,
+              keep_partial=False, config=None):
     """
-    Main function to orchestrate the IOC extraction process.
+    Stream IOCs using the extraction mode selected in the configuration.
+    
+    Args:
+        connection: MySQL connection object
+        db_path: Path to the SQLite cache holding the incremental watermark
+            (None will use config value)
+        state: Dictionary that receives extractor state to persist with the
+            cache, see iter_iocs_incremental
+        pool: MySQL connection pool; with extraction.parallelism above 1
+            the attribute types are extracted concurrently from it
+        resume_after_id: Attribute id a paginated extraction resumes after
+            (None will use config value)
+        cache_state: Extractor state of the cache, as returned by
+            load_cache_state (None will read it from db_path)
+        keep_partial: Keep the rows a paginated extraction read before a
+            database error instead of raising it; only for a cache that is
+            updated in place
+        config: Configuration dictionary (None will use get_config())
+        
+    Returns:
+        iterator: IOC dictionaries
     """
-    try:
-        # Connect to the database
-        connection = connect_to_db()
-        if not connection:
-            logger.error("Failed to connect to database. Exiting.")
-            sys.exit(1)
-            
-        # Fetch the recent IOCs
-        hours_lookback = config['extraction']['hours_lookback']
-        logger.info(f"Fetching IOCs from the last {hours_lookback} hours")
-        iocs = fetch_recent_iocs(connection)
+    if config is None:
+        config = get_config()
+    
+    mode = config['extraction'].get('mode', 'window')
+    if mode == 'paginated':
+        def make_shard(shard_connection, ioc_types, shard_state):
+            return iter_iocs_paginated(shard_connection, after_id=resume_after_id, ioc_types=ioc_types,
+                                       keep_partial=keep_partial, config=config)
+    elif mode == 'incremental':
+        if cache_state is None:
+            if db_path is None:
+                db_path = os.path.join(SCRIPT_DIR, config['output']['cache_db'])
+            cache_state = load_cache_state(db_path)
+        watermark = None
+        # A cache in an older layout is rebuilt, starting from the lookback window
+        if 'watermark_timestamp' in cache_state and cache_state.get('schema_version') == SCHEMA_VERSION:
+            watermark = (int(cache_state['watermark_timestamp']),
+                         int(cache_state['watermark_attribute_id']))
         
-        if not iocs:
-            logger.warning("No IOCs found in the specified time period")
-        else:
-            # Save to JSON file
-            json_file = config['output']['json_file']
-            json_path = os.path.join(SCRIPT_DIR, json_file)
-            save_to_json(iocs, json_path)
-            
-            # Save to cache database
-            db_file = config['output']['cache_db']
-            db_path = os.path.join(SCRIPT_DIR, db_file)
-            save_to_cache_db(iocs, db_path)
-            
-            logger.info(f"Process completed successfully. Retrieved {len(iocs)} IOCs.")
-            
-    except Exception as e:
-        logger.error(f"An unexpected error occurred: {e}")
-    finally:
-        # Close the database connection
-        if 'connection' in locals() and connection and connection.is_connected():
-            connection.close()
-            logger.info("Database connection closed")
+        def make_shard(shard_connection, ioc_types, shard_state):
+            return iter_iocs_incremental(shard_connection, watermark, state=shard_state, ioc_types=ioc_types,
+                                         config=config)
+    else:
+        def make_shard(shard_connection, ioc_types, shard_state):
+            return iter_recent_iocs(shard_connection, ioc_types=ioc_types, config=config)
+    
+    if pool is not None and config['extraction'].get('parallelism', 1) > 1:
+        return iter_iocs_parallel(pool, make_shard, state=state, config=config)
+    return make_shard(connection, config['extraction']['ioc_types'], state)
+
+
+def canonicalize_iocs(iocs):
+    """
+    Add the canonical form of each IOC value as canonical_value.
+    
+    Hashes and domains are lowercased, defanged values refanged, trailing
+    dots stripped and IP addresses and URLs normalised according to the
+    attribute type, so lookups can match the indexed canonical_value
+    exactly instead of using LOWER() in SQL.
+    
+    Args:
+        iocs: Iterable of IOC dictionaries
+        
+    Yields:
+        dict: The same IOC dictionaries with canonical_value set; tombstones
+            are passed through unchanged
+    """
+    from ioc_lookup import canonical_rule
+    
+    for ioc in iocs:
+        if 'tombstone' in ioc:
+            yield ioc
+            continue
+        value = ioc['attribute_value']
+        ioc['canonical_value'] = canonical_rule(ioc['attribute_type'])(value) if value is not None else None
+        yield ioc
+
+
+def fetch_recent_iocs(connection, hours=None, config=None):
+    """
+    Fetch IOCs from the MISP database that were created or updated 
+    in the last specified number of hours.
+    
+    This materialises the whole result; use iter_recent_iocs to process
+    large windows as a stream. Attributes that are not extracted, such as
+    soft-deleted ones, are left out.
+    
+    Args:
+        connection: MySQL connection object
+        hours: Number of hours to look back (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+        
+    Returns:
+        list: List of dictionaries containing IOC data, empty if the query
+            failed
+    """
+    from mysql.connector import Error
+    try:
+        return [ioc for ioc in iter_recent_iocs(connection, hours, config=config) if 'tombstone' not in ioc]
+    except Error:
+        return []
+
+
+# Output buffer for the JSON writer
+JSON_BUFFER_SIZE = 1024 * 1024
+
+# JSON backends tried in order when json_serializer is "auto"
+JSON_BACKENDS = ('orjson', 'msgspec', 'stdlib')
+
+
+def json_default(obj):
+    """
+    Encode values the MySQL driver returns that JSON has no type for.
+    
+    Dates and datetimes become ISO 8601 strings, Decimals keep their exact
+    digits as strings and bytes are base64 encoded, matching what msgspec
+    does natively so every backend produces the same output.
+    
+    Args:
+        obj: Value that the JSON backend could not encode
+        
+    Returns:
+        str: JSON-compatible representation of obj
+    """
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    import base64
+    import decimal
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, (bytes, bytearray)):
+        return base64.b64encode(obj).decode('ascii')
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def get_json_encoder(backend=None, pretty=False, config=None):
+    """
+    Build a function that serializes one IOC to UTF-8 encoded JSON.
+    
+    orjson and msgspec are used when installed and fall back to the
+    standard library otherwise. Indented output always uses the standard
+    library so the pretty-printed file keeps its 4-space layout.
+    
+    Args:
+        backend: "auto", "orjson", "msgspec" or "stdlib" (None will use config value)
+        pretty: Indent the output by 4 spaces
+        config: Configuration dictionary (None will use get_config())
+        
+    Returns:
+        tuple: (backend name, function taking an object and returning bytes)
+    """
+    if config is None:
+        config = get_config()
+    
+    if backend is None:
+        backend = config['output'].get('json_serializer', 'auto')
+    candidates = JSON_BACKENDS if backend == 'auto' else (backend, 'stdlib')
+    if pretty:
+        candidates = ('stdlib',)
+    
+    for name in candidates:
+        if name == 'orjson':
+            try:
+                import orjson
+            except ImportError:
+                continue
+            return name, functools.partial(orjson.dumps, default=json_default)
+        if name == 'msgspec':
+            try:
+                import msgspec
+            except ImportError:
+                continue
+            return name, msgspec.json.Encoder(enc_hook=json_default).encode
+        if name == 'stdlib':
+            break
+        logger.warning(f"Unknown JSON serializer {name}, using the standard library")
+        break
+    
+    if pretty:
+        encoder = json.JSONEncoder(indent=4, default=json_default)
+    else:
+        encoder = json.JSONEncoder(separators=(',', ':'), default=json_default)
+    return 'stdlib', lambda obj: encoder.encode(obj).encode('utf-8')
+
+
+def stream_to_json(iocs, output_file=None, json_format=None, compact=None, config=None):
+    """
+    Write IOCs to a JSON file as they pass through.
+    
+    Each IOC is written as soon as it is received and then yielded
+    unchanged, so the JSON output can be chained in front of another
+    consumer without holding the rows in memory. The file is written
+    under a temporary name and renamed over output_file only once every
+    IOC has been written, so a crash never leaves a truncated file behind.
+    Rows are serialized with get_json_encoder. Tombstones are passed on
+    without being written.
+    
+    Args:
+        iocs: Iterable of IOC dictionaries
+        output_file: File path for the JSON output (None will use config value)
+        json_format: "json" for a JSON array or "ndjson" for one object per
+            line (None will use config value)
+        compact: Write the array without indentation, one object per line
+            (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+        
+    Yields:
+        dict: The IOC dictionaries from iocs
+    """
+    if config is None:
+        config = get_config()
+    
+    if output_file is None:
+        output_file = os.path.join(SCRIPT_DIR, config['output']['json_file'])
+    if json_format is None:
+        json_format = config['output'].get('json_format', 'json')
+    if compact is None:
+        compact = config['output'].get('json_compact', False)
+    pretty = json_format != 'ndjson' and not compact
+    
+    # Text written before the first item, between items and at the end
+    if json_format == 'ndjson':
+        opening, first, separator, closing = b'', b'', b'\n', b'\n'
+    elif compact:
+        opening, first, separator, closing = b'[', b'\n', b',\n', b'\n]\n'
+    else:
+        opening, first, separator, closing = b'[', b'\n    ', b',\n    ', b'\n]\n'
+    backend, encode = get_json_encoder(pretty=pretty, config=config)
+    if pretty:
+        plain_encode = encode
+        def encode(ioc):
+            return plain_encode(ioc).replace(b'\n', b'\n    ')
+    
+    tmp_file = output_file + '.tmp'
+    f = None
+    count = 0
+    try:
+        try:
+            f = open(tmp_file, 'wb', buffering=JSON_BUFFER_SIZE)
+            f.write(opening)
+        except Exception as e:
+            logger.error(f"Error saving IOCs to file {output_file}: {e}")
+            f = None
+            
+        for ioc in iocs:
+            if 'tombstone' in ioc:
+                yield ioc
+                continue
+            if f is not None:
+                try:
+                    f.write((separator if count else first) + encode(ioc))
+                except Exception as e:
+                    logger.error(f"Error saving IOCs to file {output_file}: {e}")
+                    f.close()
+                    os.remove(tmp_file)
+                    f = None
+            count += 1
+            yield ioc
+            
+        if f is not None:
+            if count or json_format != 'ndjson':
+                f.write(closing)
+            f.close()
+            f = None
+            os.replace(tmp_file, output_file)
+            logger.info(f"Successfully saved {count} IOCs to {output_file} using {backend} JSON serializer")
+    finally:
+        # The stream was abandoned part way; drop the incomplete file
+        if f is not None:
+            f.close()
+            os.remove(tmp_file)
+
+
+def save_to_json(iocs, output_file=None, config=None):
+    """
+    Save the IOCs to a JSON file.
+    
+    Args:
+        iocs: Iterable of IOC dictionaries
+        output_file: File path for the JSON output (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+    """
+    for _ in stream_to_json(iocs, output_file, config=config):
+        pass
+
+
+# Columns of the Parquet output and their Arrow types; the low-cardinality
+# string columns are dictionary-encoded
+PARQUET_COLUMNS = (
+    ('event_id', 'int64'),
+    ('event_uuid', 'string'),
+    ('event_info', 'dictionary'),
+    ('event_date', 'string'),
+    ('event_timestamp', 'string'),
+    ('attribute_id', 'int64'),
+    ('attribute_type', 'dictionary'),
+    ('attribute_category', 'dictionary'),
+    ('attribute_value', 'string'),
+    ('canonical_value', 'string'),
+    ('attribute_timestamp', 'string'),
+    ('attribute_comment', 'string'),
+    ('attribute_to_ids', 'int8'),
+)
+
+
+def stream_to_parquet(iocs, output_file=None, row_group_size=None, compression=None, config=None):
+    """
+    Write IOCs to a Parquet file as they pass through.
+    
+    Rows are collected into columns and written as one row group every
+    row_group_size IOCs, then yielded unchanged, so at most one row group
+    is held in memory. attribute_type, attribute_category and event_info
+    are dictionary-encoded. Like stream_to_json, the file is written under
+    a temporary name and renamed over output_file once complete. Requires
+    pyarrow; without it, or without a file configured, the IOCs are passed
+    through and no file is written. Tombstones are passed on without being
+    written.
+    
+    Args:
+        iocs: Iterable of IOC dictionaries
+        output_file: File path for the Parquet output (None will use config
+            value)
+        row_group_size: Number of IOCs per row group (None will use config value)
+        compression: Parquet compression codec (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+        
+    Yields:
+        dict: The IOC dictionaries from iocs
+    """
+    if config is None:
+        config = get_config()
+    
+    if output_file is None:
+        if not config['output'].get('parquet_file'):
+            logger.warning("output.parquet_file is not set, not writing a Parquet file")
+            yield from iocs
+            return
+        output_file = os.path.join(SCRIPT_DIR, config['output']['parquet_file'])
+    if row_group_size is None:
+        row_group_size = config['output'].get('parquet_row_group_size', 100000)
+    if compression is None:
+        compression = config['output'].get('parquet_compression', 'zstd')
+    
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        logger.warning(f"pyarrow is not installed, not writing Parquet file {output_file}")
+        yield from iocs
+        return
+    
+    arrow_types = {
+        'int64': pa.int64(),
+        'int8': pa.int8(),
+        'string': pa.string(),
+        'dictionary': pa.dictionary(pa.int32(), pa.string()),
+    }
+    schema = pa.schema([(name, arrow_types[kind]) for name, kind in PARQUET_COLUMNS])
+    
+    def to_array(values, kind):
+        if kind in ('string', 'dictionary'):
+            # The MySQL driver returns dates as datetime.date
+            values = [value if value is None or type(value) is str else str(value) for value in values]
+            array = pa.array(values, pa.string())
+            return array.dictionary_encode() if kind == 'dictionary' else array
+        return pa.array(values, arrow_types[kind])
+    
+    def write_row_group(rows):
+        # IOCs that did not pass through canonicalize_iocs have no
+        # canonical_value; missing columns are written as nulls
+        columns = [to_array([row.get(name) for row in rows], kind) for name, kind in PARQUET_COLUMNS]
+        writer.write_table(pa.Table.from_arrays(columns, schema=schema), row_group_size=len(rows))
+    
+    tmp_file = output_file + '.tmp'
+    writer = None
+    rows = []
+    count = 0
+    try:
+        try:
+            writer = pq.ParquetWriter(tmp_file, schema, compression=compression)
+        except Exception as e:
+            logger.error(f"Error saving IOCs to Parquet file {output_file}: {e}")
+            writer = None
+        
+        for ioc in iocs:
+            if 'tombstone' in ioc:
+                yield ioc
+                continue
+            if writer is not None:
+                rows.append(ioc)
+                if len(rows) >= row_group_size:
+                    try:
+                        write_row_group(rows)
+                    except Exception as e:
+                        logger.error(f"Error saving IOCs to Parquet file {output_file}: {e}")
+                        writer.close()
+                        os.remove(tmp_file)
+                        writer = None
+                    rows = []
+            count += 1
+            yield ioc
+        
+        if writer is not None:
+            try:
+                if rows:
+                    write_row_group(rows)
+                writer.close()
+                writer = None
+                os.replace(tmp_file, output_file)
+                logger.info(f"Successfully saved {count} IOCs to Parquet file {output_file}")
+            except Exception as e:
+                logger.error(f"Error saving IOCs to Parquet file {output_file}: {e}")
+    finally:
+        # The stream was abandoned part way or the last row group failed
+        if writer is not None:
+            writer.close()
+            os.remove(tmp_file)
+
+
+def save_to_parquet(iocs, output_file=None, config=None):
+    """
+    Save the IOCs to a Parquet file.
+    
+    Args:
+        iocs: Iterable of IOC dictionaries
+        output_file: File path for the Parquet output (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+    """
+    for _ in stream_to_parquet(iocs, output_file, config=config):
+        pass
+
+
+def backup_cache_db(db_path, backup_path=None, config=None):
+    """
+    Create a backup of the existing cache database.
+    
+    The backup is a hard link to the current file where the filesystem
+    allows it (falling back to a copy), and it replaces any previous
+    backup in one rename. The current cache is left in place.
+    
+    Args:
+        db_path: Path to the current SQLite database file
+        backup_path: Path where backup will be saved (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+    
+    Returns:
+        bool: True if backup was successful or not needed, False if it failed
+    """
+    if config is None:
+        config = get_config()
+    
+    if backup_path is None:
+        backup_path = os.path.join(SCRIPT_DIR, config['output'].get('backup_db', 'ioc_cache_yesterday.db'))
+    
+    try:
+        # Check if the current cache exists
+        if os.path.exists(db_path):
+            # Backup the existing file
+            staging_path = backup_path + '.tmp'
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+            try:
+                os.link(db_path, staging_path)
+            except OSError:
+                import shutil
+                shutil.copy2(db_path, staging_path)
+            os.replace(staging_path, backup_path)
+            logger.info(f"Created backup of IOC cache at {backup_path}")
+        else:
+            logger.info(f"No existing IOC cache found at {db_path}, no backup needed")
+        return True
+    except Exception as e:
+        logger.error(f"Error backing up cache database: {e}")
+        return False
+
+
+def swap_cache_db(build_path, db_path, backup_path=None, config=None):
+    """
+    Atomically replace the cache database with a newly built one.
+    
+    The current cache is rotated to the backup path first. Readers that
+    already have the old file open keep using it, and new readers see
+    either the old or the new file, never a missing or partial one.
+    
+    Args:
+        build_path: Path to the fully built and indexed new database
+        db_path: Path to the current SQLite database file
+        backup_path: Path where the old cache will be kept (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+    
+    Raises:
+        sqlite3.Error: If the WAL of the current cache could not be folded
+            back into it; the current cache is left in place
+    """
+    import sqlite3
+    
+    # Make sure the new file is on disk before it becomes visible
+    fd = os.open(build_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    
+    # A WAL file left by an incremental cache would be applied to the new
+    # file, so fold it back into the old database first. If a reader keeps
+    # it open the fold fails, and the swap must not go ahead
+    wal_path = db_path + '-wal'
+    if os.path.exists(wal_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            journal_mode = conn.execute('PRAGMA journal_mode = DELETE').fetchone()[0]
+        finally:
+            conn.close()
+        if journal_mode.lower() != 'delete' or os.path.exists(wal_path):
+            raise sqlite3.OperationalError(f"WAL of {db_path} is still in use")
+    
+    if not backup_cache_db(db_path, backup_path, config):
+        logger.warning("Replacing IOC cache without backup")
+    os.replace(build_path, db_path)
+    logger.info(f"Replaced IOC cache at {db_path} with new generation")
+
+
+# Version of the cache layout, stored in extractor_state. An incremental
+# update of a cache with a different version rebuilds it instead
+SCHEMA_VERSION = '8'
+
+# Columns of the events and attributes tables filled from each IOC
+# dictionary, in insert order
+EVENT_COLUMNS = (
+    'event_id', 'event_uuid', 'event_info', 'event_date', 'event_timestamp'
+)
+ATTRIBUTE_COLUMNS = (
+    'attribute_id', 'event_id', 'attribute_type', 'attribute_category', 'attribute_value',
+    'canonical_value', 'attribute_timestamp', 'attribute_comment', 'attribute_to_ids'
+)
+
+# Tables holding md5, sha1 and sha256 digests as BLOBs
+HASH_DIGEST_TABLES = ('hash_md5', 'hash_sha1', 'hash_sha256')
+
+# Tables of lookup rows derived from attributes, keyed on attribute_id
+DERIVED_TABLES = ('ip_networks', 'domain_names', 'attribute_content') + HASH_DIGEST_TABLES
+
+# Tables of MISP tags and sightings keyed on attribute_id; unlike the
+# derived tables they are only rewritten when they are fetched again
+ENRICHMENT_TABLES = ('attribute_tags', 'attribute_sightings')
+
+# MISP sighting types, counted separately in attribute_sightings
+SIGHTING_TYPES = ('sighting_count', 'false_positive_count', 'expiration_count')
+
+# Compression schemes for the rule bodies in attribute_content
+CONTENT_COMPRESSIONS = ('zlib', 'zstd', 'none')
+
+# Ids per IN (...) list, below the bound parameter limit of SQLite
+ID_CHUNK_SIZE = 500
+
+# SQLite pragmas applied while loading the cache
+REBUILD_PRAGMAS = {
+    'journal_mode': 'MEMORY',
+    'synchronous': 'OFF',
+    'cache_size': -262144,  # 256 MiB
+    'temp_store': 'MEMORY',
+}
+INCREMENTAL_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -262144,  # 256 MiB
+    'temp_store': 'MEMORY',
+}
+
+
+def create_cache_schema(cursor):
+    """
+    Create the cache tables and the misp_iocs compatibility view.
+    
+    Event data is stored once per event in the events table and attributes
+    reference it by event_id. The misp_iocs view joins the two back into
+    the original flat layout, so existing queries keep working, and its
+    executive_summary column stays writable through an INSTEAD OF trigger.
+    
+    Args:
+        cursor: SQLite cursor on the cache database
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS events (
+        event_id INTEGER PRIMARY KEY,
+        event_uuid TEXT,
+        event_info TEXT,
+        event_date TEXT,
+        event_timestamp TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS attributes (
+        attribute_id INTEGER PRIMARY KEY,
+        event_id INTEGER,
+        attribute_type TEXT,
+        attribute_category TEXT,
+        attribute_value TEXT,
+        canonical_value TEXT,
+        attribute_timestamp TEXT,
+        attribute_comment TEXT,
+        attribute_to_ids INTEGER,
+        import_time TEXT,
+        executive_summary TEXT
+    )
+    ''')
+    
+    # Networks of the IP attributes, one row per CIDR block, so an observed
+    # address is matched with one primary key probe per prefix length
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ip_networks (
+        ip_version INTEGER,
+        prefix_length INTEGER,
+        network BLOB,
+        attribute_id INTEGER,
+        PRIMARY KEY (ip_version, prefix_length, network, attribute_id)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Domain and hostname attributes with their labels reversed
+    # ("example.evil."), so the parent domains of a hostname are prefixes
+    # of its reversed name
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS domain_names (
+        reversed_name TEXT,
+        attribute_id INTEGER,
+        PRIMARY KEY (reversed_name, attribute_id)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Rule bodies of snort, yara and sigma attributes, which only keep a
+    # digest in the attributes table so they don't bloat its pages
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS attribute_content (
+        attribute_id INTEGER PRIMARY KEY,
+        compression TEXT,
+        content BLOB
+    )
+    ''')
+    
+    # Hash digests as fixed-length BLOBs, one table per algorithm, so a
+    # hash lookup is a single short-key probe
+    for table in HASH_DIGEST_TABLES:
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            digest BLOB,
+            attribute_id INTEGER,
+            PRIMARY KEY (digest, attribute_id)
+        ) WITHOUT ROWID
+        ''')
+    
+    # MISP tags of the attributes and events in the cache. Galaxy clusters
+    # are attached through their tag, so galaxy_clusters is keyed on tag_id
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS tags (
+        tag_id INTEGER PRIMARY KEY,
+        tag_name TEXT,
+        colour TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS attribute_tags (
+        attribute_id INTEGER,
+        tag_id INTEGER,
+        PRIMARY KEY (attribute_id, tag_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS event_tags (
+        event_id INTEGER,
+        tag_id INTEGER,
+        PRIMARY KEY (event_id, tag_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS galaxy_clusters (
+        tag_id INTEGER PRIMARY KEY,
+        cluster_uuid TEXT,
+        galaxy_name TEXT,
+        galaxy_type TEXT,
+        cluster_value TEXT
+    )
+    ''')
+    
+    # Sighting counts per attribute, by MISP sighting type
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS attribute_sightings (
+        attribute_id INTEGER PRIMARY KEY,
+        sighting_count INTEGER,
+        false_positive_count INTEGER,
+        expiration_count INTEGER,
+        first_sighting TEXT,
+        last_sighting TEXT
+    )
+    ''')
+    
+    # Key/value state kept by the extractor between runs
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS extractor_state (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE VIEW IF NOT EXISTS misp_iocs AS
+    SELECT
+        a.attribute_id AS id,
+        a.event_id,
+        e.event_uuid,
+        e.event_info,
+        e.event_date,
+        e.event_timestamp,
+        a.attribute_id,
+        a.attribute_type,
+        a.attribute_category,
+        a.attribute_value,
+        a.attribute_timestamp,
+        a.attribute_comment,
+        a.attribute_to_ids,
+        a.import_time,
+        a.executive_summary,
+        a.canonical_value
+    FROM attributes a
+    LEFT JOIN events e ON e.event_id = a.event_id
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS misp_iocs_update_summary
+    INSTEAD OF UPDATE OF executive_summary ON misp_iocs
+    BEGIN
+        UPDATE attributes SET executive_summary = NEW.executive_summary
+        WHERE attribute_id = OLD.attribute_id;
+    END
+    ''')
+    
+    # Tags of every IOC, its own and those inherited from its event
+    cursor.execute('''
+    CREATE VIEW IF NOT EXISTS ioc_tags AS
+    SELECT at.attribute_id, t.tag_id, t.tag_name, 0 AS inherited
+    FROM attribute_tags at
+    JOIN tags t ON t.tag_id = at.tag_id
+    UNION ALL
+    SELECT a.attribute_id, t.tag_id, t.tag_name, 1 AS inherited
+    FROM attributes a
+    JOIN event_tags et ON et.event_id = a.event_id
+    JOIN tags t ON t.tag_id = et.tag_id
+    ''')
+    cursor.execute('''
+    CREATE VIEW IF NOT EXISTS ioc_galaxies AS
+    SELECT
+        it.attribute_id,
+        g.cluster_uuid,
+        g.galaxy_name,
+        g.galaxy_type,
+        g.cluster_value,
+        it.inherited
+    FROM ioc_tags it
+    JOIN galaxy_clusters g ON g.tag_id = it.tag_id
+    ''')
+
+
+def create_cache_indexes(cursor):
+    """
+    Create the lookup indexes on the attributes and derived tables.
+    
+    Args:
+        cursor: SQLite cursor on the cache database
+    """
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attribute_type ON attributes (attribute_type)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attribute_value ON attributes (attribute_value)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_canonical_value ON attributes (canonical_value)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_event_id ON attributes (event_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attribute_timestamp ON attributes (attribute_timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ip_networks_attribute ON ip_networks (attribute_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_domain_names_attribute ON domain_names (attribute_id)')
+    for table in HASH_DIGEST_TABLES:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_attribute ON {table} (attribute_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tags_name ON tags (tag_name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attribute_tags_tag ON attribute_tags (tag_id, attribute_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_event_tags_tag ON event_tags (tag_id, event_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_galaxy_clusters_value ON galaxy_clusters (cluster_value)')
+
+
+def load_ip_networks(cursor, chunk):
+    """
+    Write the networks of the IP attributes in a chunk to ip_networks.
+    
+    Args:
+        cursor: SQLite cursor on the cache database
+        chunk: List of IOC dictionaries
+    """
+    from ioc_lookup import IP_ATTRIBUTE_TYPES, parse_ip_networks
+    
+    rows = []
+    for ioc in chunk:
+        if ioc['attribute_type'] in IP_ATTRIBUTE_TYPES:
+            for network in parse_ip_networks(ioc['attribute_type'], ioc['canonical_value']):
+                rows.append(network + (ioc['attribute_id'],))
+    if rows:
+        cursor.executemany('''
+            INSERT OR IGNORE INTO ip_networks (ip_version, prefix_length, network, attribute_id)
+            VALUES (?, ?, ?, ?)
+            ''', rows)
+
+
+def load_domain_names(cursor, chunk):
+    """
+    Write the reversed names of the domain and hostname attributes in a
+    chunk to domain_names.
+    
+    Args:
+        cursor: SQLite cursor on the cache database
+        chunk: List of IOC dictionaries
+    """
+    from ioc_lookup import DOMAIN_ATTRIBUTE_TYPES, parse_domain_name
+    
+    rows = []
+    for ioc in chunk:
+        if ioc['attribute_type'] in DOMAIN_ATTRIBUTE_TYPES:
+            reversed_name = parse_domain_name(ioc['attribute_type'], ioc['canonical_value'])
+            if reversed_name:
+                rows.append((reversed_name, ioc['attribute_id']))
+    if rows:
+        cursor.executemany(
+            'INSERT OR IGNORE INTO domain_names (reversed_name, attribute_id) VALUES (?, ?)', rows)
+
+
+def load_hash_digests(cursor, chunk):
+    """
+    Write the binary digests of the md5, sha1 and sha256 attributes in a
+    chunk to the hash digest tables.
+    
+    Args:
+        cursor: SQLite cursor on the cache database
+        chunk: List of IOC dictionaries
+    """
+    from ioc_lookup import HASH_TABLES, parse_hash_digests
+    
+    # Whether each attribute type seen has a hash component
+    hash_types = {}
+    rows = {}
+    for ioc in chunk:
+        attribute_type = ioc['attribute_type']
+        has_hash = hash_types.get(attribute_type)
+        if has_hash is None:
+            has_hash = hash_types[attribute_type] = any(
+                part in HASH_TABLES for part in attribute_type.split('|'))
+        if not has_hash:
+            continue
+        for table, digest in parse_hash_digests(attribute_type, ioc['canonical_value']):
+            rows.setdefault(table, []).append((digest, ioc['attribute_id']))
+    for table, table_rows in rows.items():
+        cursor.executemany(f'INSERT OR IGNORE INTO {table} (digest, attribute_id) VALUES (?, ?)', table_rows)
+
+
+def get_content_compression(compression=None, config=None):
+    """
+    Resolve the compression used for rule bodies in attribute_content.
+    
+    Args:
+        compression: "zlib", "zstd" or "none" (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+        
+    Returns:
+        str: Usable compression; zstd falls back to zlib if the zstandard
+            package is not installed
+    """
+    if config is None:
+        config = get_config()
+    
+    if compression is None:
+        compression = config['output'].get('content_compression', 'zlib')
+    if compression not in CONTENT_COMPRESSIONS:
+        logger.warning(f"Unknown content compression {compression}, using zlib")
+        return 'zlib'
+    if compression == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            logger.warning("zstandard is not installed, compressing rule content with zlib")
+            return 'zlib'
+    return compression
+
+
+def split_attribute_content(chunk, compression):
+    """
+    Move the rule bodies of snort, yara and sigma attributes out of a chunk.
+    
+    Args:
+        chunk: List of IOC dictionaries
+        compression: Compression for the stored content
+        
+    Returns:
+        tuple: (chunk with the rule bodies replaced by their sha256 digest,
+            list of attribute_content rows)
+    """
+    import hashlib
+    from ioc_lookup import CONTENT_ATTRIBUTE_TYPES, compress_content
+    
+    content_rows = []
+    hot_chunk = []
+    for ioc in chunk:
+        content = ioc['attribute_value']
+        if ioc['attribute_type'] in CONTENT_ATTRIBUTE_TYPES and content is not None:
+            digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+            content_rows.append((ioc['attribute_id'], compression, compress_content(compression, content)))
+            ioc = dict(ioc, attribute_value=digest, canonical_value=digest)
+        hot_chunk.append(ioc)
+    return hot_chunk, content_rows
+
+
+def load_derived_rows(cursor, chunk, incremental=False):
+    """
+    Fill the derived lookup tables from a chunk of IOCs.
+    
+    Args:
+        cursor: SQLite cursor on the cache database
+        chunk: List of IOC dictionaries
+        incremental: Replace the rows already stored for these attributes
+    """
+    if incremental:
+        attribute_ids = [(ioc['attribute_id'],) for ioc in chunk]
+        for table in DERIVED_TABLES:
+            cursor.executemany(f'DELETE FROM {table} WHERE attribute_id = ?', attribute_ids)
+    load_ip_networks(cursor, chunk)
+    load_domain_names(cursor, chunk)
+    load_hash_digests(cursor, chunk)
+
+
+def load_cache_rows(cursor, iocs, import_time, incremental=False, chunk_size=None, config=None):
+    """
+    Write IOCs into the events and attributes tables.
+    
+    IOCs are converted to parameter tuples with itemgetter and written with
+    executemany in chunks. Each event is only written when it is first seen
+    or its timestamp changed, so an event with thousands of attributes is
+    stored once. In incremental mode attributes are upserted on
+    attribute_id and only rewritten if their timestamp changed. The
+    derived lookup tables are filled from the same chunks. IOCs that did
+    not pass through canonicalize_iocs are canonicalised here. Rule bodies
+    are stored in attribute_content and replaced by their sha256 digest in
+    the attributes table; the IOC dictionaries are not modified. In
+    incremental mode the attributes and events of tombstones are deleted;
+    a fresh cache cannot hold them, so they are skipped otherwise.
+    
+    Args:
+        cursor: SQLite cursor on the cache database
+        iocs: Iterable of IOC dictionaries
+        import_time: Value stored in the import_time column
+        incremental: Upsert into an existing cache
+        chunk_size: Number of IOCs per executemany call (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+        
+    Returns:
+        int: Number of IOCs inserted, changed or deleted; IOCs that were
+            already stored unchanged are not counted
+    """
+    if config is None:
+        config = get_config()
+    
+    if chunk_size is None:
+        chunk_size = config['output'].get('insert_chunk_size', 10000)
+    
+    event_sql = '''
+        INSERT INTO events (
+            event_id, event_uuid, event_info, event_date, event_timestamp
+        ) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (event_id) DO UPDATE SET
+            event_uuid = excluded.event_uuid,
+            event_info = excluded.event_info,
+            event_date = excluded.event_date,
+            event_timestamp = excluded.event_timestamp
+        WHERE events.event_timestamp IS NOT excluded.event_timestamp
+        '''
+    attribute_sql = '''
+        INSERT INTO attributes (
+            attribute_id, event_id, attribute_type, attribute_category, attribute_value,
+            canonical_value, attribute_timestamp, attribute_comment, attribute_to_ids, import_time
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        '''
+    if incremental:
+        # Attributes whose timestamp is unchanged are left alone, so an
+        # unchanged IOC costs one primary key probe and no write
+        attribute_sql += '''
+        ON CONFLICT (attribute_id) DO UPDATE SET
+            event_id = excluded.event_id,
+            attribute_type = excluded.attribute_type,
+            attribute_category = excluded.attribute_category,
+            attribute_value = excluded.attribute_value,
+            canonical_value = excluded.canonical_value,
+            attribute_timestamp = excluded.attribute_timestamp,
+            attribute_comment = excluded.attribute_comment,
+            attribute_to_ids = excluded.attribute_to_ids,
+            import_time = excluded.import_time
+        WHERE attributes.attribute_timestamp IS NOT excluded.attribute_timestamp
+        '''
+    
+    get_event = operator.itemgetter(*EVENT_COLUMNS)
+    get_attribute = operator.itemgetter(*ATTRIBUTE_COLUMNS)
+    suffix = (import_time,)
+    compression = get_content_compression(config=config)
+    # event_timestamp last written for each event during this load
+    written_events = {}
+    count = 0
+    deleted = 0
+    
+    iocs = iter(iocs)
+    while True:
+        chunk = list(itertools.islice(iocs, chunk_size))
+        if not chunk:
+            break
+        tombstones = [ioc for ioc in chunk if 'tombstone' in ioc]
+        if tombstones:
+            chunk = [ioc for ioc in chunk if 'tombstone' not in ioc]
+            if incremental:
+                deleted += delete_tombstones(cursor, tombstones)
+            if not chunk:
+                continue
+        if 'canonical_value' not in chunk[0]:
+            chunk = list(canonicalize_iocs(chunk))
+        chunk, content_rows = split_attribute_content(chunk, compression)
+        events = {}
+        for ioc in chunk:
+            event = get_event(ioc)
+            if event[0] not in written_events or written_events[event[0]] != event[4]:
+                events[event[0]] = event
+        if events:
+            cursor.executemany(event_sql, events.values())
+            written_events.update((event_id, event[4]) for event_id, event in events.items())
+        cursor.executemany(attribute_sql, [get_attribute(ioc) + suffix for ioc in chunk])
+        # Upserts skipped because the timestamp is unchanged are not counted
+        count += cursor.rowcount
+        load_derived_rows(cursor, chunk, incremental)
+        if content_rows:
+            cursor.executemany(
+                'INSERT OR REPLACE INTO attribute_content (attribute_id, compression, content) VALUES (?, ?, ?)',
+                content_rows)
+    if deleted:
+        logger.info(f"Deleted {deleted} IOCs that are no longer extracted from cache database")
+    return count + deleted
+
+
+def expire_cache_rows(cursor, retention_hours):
+    """
+    Delete IOCs whose attribute and event are both older than the retention window.
+    
+    Events left without attributes and the derived lookup rows of the
+    expired attributes are deleted as well.
+    
+    Args:
+        cursor: SQLite cursor on the cache database
+        retention_hours: Number of hours of IOCs to keep
+        
+    Returns:
+        int: Number of IOCs deleted
+    """
+    cutoff_time = datetime.datetime.now() - datetime.timedelta(hours=retention_hours)
+    cutoff = cutoff_time.strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute('''
+        DELETE FROM attributes
+        WHERE attribute_timestamp < ?
+            AND event_id IN (SELECT event_id FROM events WHERE event_timestamp < ?)
+        ''', (cutoff, cutoff))
+    expired = cursor.rowcount
+    cursor.execute('DELETE FROM events WHERE event_id NOT IN (SELECT event_id FROM attributes)')
+    if expired:
+        for table in DERIVED_TABLES + ENRICHMENT_TABLES:
+            cursor.execute(f'DELETE FROM {table} WHERE attribute_id NOT IN (SELECT attribute_id FROM attributes)')
+        cursor.execute('DELETE FROM event_tags WHERE event_id NOT IN (SELECT event_id FROM events)')
+    logger.info(f"Expired {expired} IOCs older than {retention_hours} hours from cache database")
+    return expired
+
+
+def delete_cache_rows(cursor, attribute_ids):
+    """
+    Delete IOCs by attribute id.
+    
+    The derived lookup rows, tags and sightings of the deleted attributes
+    are deleted as well, and so are their events if no attributes are
+    left in them.
+    
+    Args:
+        cursor: SQLite cursor on the cache database
+        attribute_ids: Iterable of attribute ids
+        
+    Returns:
+        int: Number of IOCs deleted
+    """
+    attribute_ids = list(attribute_ids)
+    event_ids = set()
+    deleted = 0
+    for start in range(0, len(attribute_ids), ID_CHUNK_SIZE):
+        chunk = attribute_ids[start:start + ID_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        event_ids.update(row[0] for row in cursor.execute(
+            f'SELECT DISTINCT event_id FROM attributes WHERE attribute_id IN ({placeholders})', chunk))
+        cursor.execute(f'DELETE FROM attributes WHERE attribute_id IN ({placeholders})', chunk)
+        deleted += cursor.rowcount
+        for table in DERIVED_TABLES + ENRICHMENT_TABLES:
+            cursor.execute(f'DELETE FROM {table} WHERE attribute_id IN ({placeholders})', chunk)
+    cursor.executemany('''
+        DELETE FROM events
+        WHERE event_id = ?
+            AND NOT EXISTS (SELECT 1 FROM attributes WHERE attributes.event_id = events.event_id)
+        ''', [(event_id,) for event_id in event_ids])
+    cursor.executemany('''
+        DELETE FROM event_tags
+        WHERE event_id = ?
+            AND NOT EXISTS (SELECT 1 FROM events WHERE events.event_id = event_tags.event_id)
+        ''', [(event_id,) for event_id in event_ids])
+    return deleted
+
+
+def delete_cache_events(cursor, event_ids):
+    """
+    Delete events and all of their IOCs.
+    
+    Args:
+        cursor: SQLite cursor on the cache database
+        event_ids: Iterable of event ids
+        
+    Returns:
+        int: Number of IOCs deleted
+    """
+    event_ids = list(event_ids)
+    attribute_ids = []
+    for start in range(0, len(event_ids), ID_CHUNK_SIZE):
+        chunk = event_ids[start:start + ID_CHUNK_SIZE]
+        attribute_ids.extend(row[0] for row in cursor.execute(
+            f"SELECT attribute_id FROM attributes WHERE event_id IN ({','.join('?' * len(chunk))})", chunk))
+    deleted = delete_cache_rows(cursor, attribute_ids)
+    cursor.executemany('DELETE FROM events WHERE event_id = ?', [(event_id,) for event_id in event_ids])
+    cursor.executemany('DELETE FROM event_tags WHERE event_id = ?', [(event_id,) for event_id in event_ids])
+    return deleted
+
+
+def delete_tombstones(cursor, tombstones):
+    """
+    Delete the attributes and events of tombstones from the cache.
+    
+    Args:
+        cursor: SQLite cursor on the cache database
+        tombstones: List of tombstones, see ioc_row_converter
+        
+    Returns:
+        int: Number of IOCs deleted
+    """
+    deleted = delete_cache_rows(
+        cursor, [ioc['attribute_id'] for ioc in tombstones if ioc['attribute_id'] is not None])
+    deleted += delete_cache_events(
+        cursor, [ioc['event_id'] for ioc in tombstones if ioc['attribute_id'] is None])
+    return deleted
+
+
+def fetch_in_batches(connection, query, ids, batch_size):
+    """
+    Run a MISP query once per batch of ids instead of once per id.
+    
+    Args:
+        connection: MySQL connection object
+        query: Query with a {} placeholder for the IN (...) list
+        ids: List of ids
+        batch_size: Number of ids per query
+        
+    Yields:
+        tuple: Result row
+    """
+    cursor = connection.cursor()
+    try:
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            cursor.execute(query.format(','.join(['%s'] * len(chunk))), chunk)
+            rows = cursor.fetchall()
+            # End the read transaction so MISP is not kept on an old snapshot
+            connection.commit()
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def load_enrichment_rows(cursor, connection, import_time=None, batch_size=None, event_ids=None, config=None):
+    """
+    Fetch the tags, galaxy clusters and sightings of the cached IOCs from MISP.
+    
+    The attribute_tags, event_tags and sightings of the IOCs are read in
+    batches of batch_size ids, followed by the tags and galaxy clusters
+    they reference, so the number of queries does not grow with the number
+    of events. Sightings are stored as counts per attribute and sighting
+    type. Everything is read before the cache is touched, so a failed
+    query leaves the stored rows as they were.
+    
+    With import_time only the IOCs written at that time are fetched again,
+    together with the IOCs sighted since the sighting_watermark stored in
+    extractor_state. Tagging an event only changes events.timestamp, not
+    its attributes, so the tags of the cached events changed since the
+    event_tag_watermark are fetched again as well.
+    
+    Args:
+        cursor: SQLite cursor on the cache database
+        connection: MySQL connection object
+        import_time: Only enrich the IOCs with this import_time (None
+            enriches every IOC)
+        batch_size: Number of ids per query (None will use config value)
+        event_ids: Further events whose tags are fetched again, such as
+            the events updated in a binlog batch; events the cache does
+            not hold are ignored (optional)
+        config: Configuration dictionary (None will use get_config())
+        
+    Returns:
+        dict: New sighting_watermark and event_tag_watermark to store in
+            extractor_state, or None if the enrichment failed
+    """
+    from mysql.connector import Error
+    if config is None:
+        config = get_config()
+    
+    if batch_size is None:
+        batch_size = config['extraction'].get('enrichment_batch_size', 5000)
+    
+    if import_time is None:
+        rows = cursor.execute('SELECT attribute_id, event_id FROM attributes').fetchall()
+    else:
+        rows = cursor.execute(
+            'SELECT attribute_id, event_id FROM attributes WHERE import_time = ?', (import_time,)).fetchall()
+    attribute_ids = [row[0] for row in rows]
+    changed_event_ids = list(event_ids or ())
+    event_ids = {row[1] for row in rows}
+    
+    def cached_ids(table, column, ids):
+        found = set()
+        for start in range(0, len(ids), ID_CHUNK_SIZE):
+            chunk = ids[start:start + ID_CHUNK_SIZE]
+            found.update(row[0] for row in cursor.execute(
+                f"SELECT {column} FROM {table} WHERE {column} IN ({','.join('?' * len(chunk))})", chunk))
+        return found
+    
+    try:
+        mysql_cursor = connection.cursor()
+        try:
+            mysql_cursor.execute('SELECT MAX(id) FROM sightings')
+            sighting_watermark = mysql_cursor.fetchone()[0] or 0
+            mysql_cursor.execute('SELECT MAX(timestamp) FROM events')
+            event_tag_watermark = mysql_cursor.fetchone()[0] or 0
+            connection.commit()
+            sighted_ids = attribute_ids
+            state = dict(cursor.execute(
+                "SELECT key, value FROM extractor_state WHERE key IN ('sighting_watermark', 'event_tag_watermark')"))
+            if import_time is not None and 'sighting_watermark' in state:
+                mysql_cursor.execute(
+                    'SELECT DISTINCT attribute_id FROM sightings WHERE id > %s', (int(state['sighting_watermark']),))
+                new_ids = [row[0] for row in mysql_cursor.fetchall()]
+                connection.commit()
+                sighted_ids = sorted(set(attribute_ids) | cached_ids('attributes', 'attribute_id', new_ids))
+            if import_time is not None and 'event_tag_watermark' in state:
+                # Events saved late with an older timestamp are picked up
+                # by the same overlap as the attributes
+                overlap = config['extraction'].get('incremental_overlap_seconds', 60)
+                mysql_cursor.execute(
+                    'SELECT id FROM events WHERE timestamp >= %s', (int(state['event_tag_watermark']) - overlap,))
+                changed_event_ids.extend(row[0] for row in mysql_cursor.fetchall())
+                connection.commit()
+            event_ids = sorted(event_ids | cached_ids('events', 'event_id', changed_event_ids))
+        finally:
+            mysql_cursor.close()
+        
+        attribute_tags = list(fetch_in_batches(
+            connection, 'SELECT attribute_id, tag_id FROM attribute_tags WHERE attribute_id IN ({})',
+            attribute_ids, batch_size))
+        event_tags = list(fetch_in_batches(
+            connection, 'SELECT event_id, tag_id FROM event_tags WHERE event_id IN ({})',
+            event_ids, batch_size))
+        tag_ids = sorted({row[1] for row in attribute_tags} | {row[1] for row in event_tags})
+        tags = list(fetch_in_batches(
+            connection, 'SELECT id, name, colour FROM tags WHERE id IN ({})', tag_ids, batch_size))
+        galaxy_tags = {name: tag_id for tag_id, name, _ in tags if name.startswith('misp-galaxy:')}
+        clusters = list(fetch_in_batches(connection, '''
+            SELECT gc.tag_name, gc.uuid, g.name, gc.type, gc.value
+            FROM galaxy_clusters gc
+            JOIN galaxies g ON g.id = gc.galaxy_id
+            WHERE gc.tag_name IN ({})
+            ''', list(galaxy_tags), batch_size))
+        sightings = list(fetch_in_batches(connection, '''
+            SELECT attribute_id, type, COUNT(*), MIN(date_sighting), MAX(date_sighting)
+            FROM sightings
+            WHERE attribute_id IN ({})
+            GROUP BY attribute_id, type
+            ''', sighted_ids, batch_size))
+    except Error as e:
+        logger.error(f"Error fetching tags and sightings from MISP database: {e}")
+        return None
+    
+    if import_time is not None:
+        cursor.executemany('DELETE FROM attribute_tags WHERE attribute_id = ?', [(i,) for i in attribute_ids])
+        cursor.executemany('DELETE FROM event_tags WHERE event_id = ?', [(i,) for i in event_ids])
+        cursor.executemany('DELETE FROM attribute_sightings WHERE attribute_id = ?', [(i,) for i in sighted_ids])
+    cursor.executemany('INSERT OR IGNORE INTO attribute_tags (attribute_id, tag_id) VALUES (?, ?)', attribute_tags)
+    cursor.executemany('INSERT OR IGNORE INTO event_tags (event_id, tag_id) VALUES (?, ?)', event_tags)
+    cursor.executemany('INSERT OR REPLACE INTO tags (tag_id, tag_name, colour) VALUES (?, ?, ?)', tags)
+    cursor.executemany('''
+        INSERT OR REPLACE INTO galaxy_clusters (
+            tag_id, cluster_uuid, galaxy_name, galaxy_type, cluster_value
+        ) VALUES (?, ?, ?, ?, ?)
+        ''', [(galaxy_tags[tag_name],) + tuple(row) for tag_name, *row in clusters])
+    
+    # Fold the per-type counts into one row per attribute
+    counts = {}
+    for attribute_id, sighting_type, count, first, last in sightings:
+        entry = counts.setdefault(attribute_id, [0] * len(SIGHTING_TYPES) + [first, last])
+        if 0 <= int(sighting_type) < len(SIGHTING_TYPES):
+            entry[int(sighting_type)] += count
+        entry[-2] = min(entry[-2], first)
+        entry[-1] = max(entry[-1], last)
+    cursor.executemany('''
+        INSERT OR REPLACE INTO attribute_sightings (
+            attribute_id, sighting_count, false_positive_count, expiration_count,
+            first_sighting, last_sighting
+        ) VALUES (?, ?, ?, ?, ?, ?)
+        ''', [
+            (attribute_id, *entry[:-2],
+             datetime.datetime.fromtimestamp(int(entry[-2])).strftime("%Y-%m-%d %H:%M:%S"),
+             datetime.datetime.fromtimestamp(int(entry[-1])).strftime("%Y-%m-%d %H:%M:%S"))
+            for attribute_id, entry in counts.items()
+        ])
+    
+    logger.info(f"Stored {len(attribute_tags) + len(event_tags)} tags, {len(clusters)} galaxy clusters "
+                f"and sightings of {len(counts)} IOCs from the MISP database")
+    return {'sighting_watermark': sighting_watermark, 'event_tag_watermark': event_tag_watermark}
+
+
+def save_to_cache_db(iocs, db_path=None, incremental=False, state=None, connection=None, config=None):
+    """
+    Save the IOCs to a SQLite cache database.
+    
+    By default a new cache is built into a temporary file next to db_path,
+    indexed and analyzed, and then swapped in with swap_cache_db. In
+    incremental mode the existing cache is kept: IOCs are upserted on
+    attribute_id, rows that did not change are not rewritten, and rows
+    older than output.retention_hours are expired. A cache in an older
+    layout is rebuilt instead.
+    
+    Args:
+        iocs: Iterable of IOC dictionaries
+        db_path: Path to the SQLite database file (None will use config value)
+        incremental: Update the existing cache instead of rebuilding it
+        state: Dictionary of extractor state entries to store in the same
+            transaction; it is read after all IOCs have been consumed
+        connection: MySQL connection to fetch the tags, galaxy clusters and
+            sightings of the IOCs from, see load_enrichment_rows (optional)
+        config: Configuration dictionary (None will use get_config())
+        
+    Returns:
+        int: Number of IOCs saved or deleted, or None if the cache could
+            not be written
+    """
+    if config is None:
+        config = get_config()
+    
+    if db_path is None:
+        db_path = os.path.join(SCRIPT_DIR, config['output']['cache_db'])
+    
+    if incremental and os.path.exists(db_path):
+        if load_cache_state(db_path).get('schema_version') != SCHEMA_VERSION:
+            logger.warning(f"Cache database {db_path} uses an older layout, rebuilding it")
+            incremental = False
+    
+    # A rebuild is written to a temporary file and swapped in when complete
+    build_path = db_path
+    if not incremental:
+        build_path = db_path + '.tmp'
+        for path in (build_path, build_path + '-journal'):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    count = 0
+    try:
+        import sqlite3
+        import uuid
+        conn = sqlite3.connect(build_path)
+        cursor = conn.cursor()
+        
+        # Load-time pragmas; a rebuilt cache can trade durability for speed
+        # because the previous generation is kept as a backup
+        pragmas = dict(INCREMENTAL_PRAGMAS if incremental else REBUILD_PRAGMAS)
+        pragmas.update(config['output'].get('sqlite_pragmas', {}))
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        
+        create_cache_schema(cursor)
+        
+        # An incremental update keeps its indexes; a fresh cache is indexed
+        # after the load so inserts don't maintain the B-trees
+        if incremental:
+            create_cache_indexes(cursor)
+        
+        # Insert IOCs into database; all chunks go into one transaction
+        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        count = load_cache_rows(cursor, iocs, current_time, incremental, config=config)
+        
+        # Tags and sightings go into the same transaction as their IOCs
+        enrichment_state = None
+        if connection is not None and config['extraction'].get('enrichment', True):
+            enrichment_state = load_enrichment_rows(
+                cursor, connection, current_time if incremental else None, config=config)
+        
+        expired = 0
+        if incremental:
+            retention_hours = config['output'].get('retention_hours', config['extraction']['hours_lookback'])
+            if retention_hours:
+                expired = expire_cache_rows(cursor, retention_hours)
+        else:
+            create_cache_indexes(cursor)
+            cursor.execute('ANALYZE')
+        
+        # A new generation id tells readers holding derived data to reload;
+        # that data only covers the IOC values, so an update that merely
+        # refreshed the enrichment keeps it
+        entries = {'schema_version': SCHEMA_VERSION}
+        if count or expired or not incremental:
+            entries['cache_generation'] = uuid.uuid4().hex
+        entries.update(enrichment_state or {})
+        entries.update(state or {})
+        cursor.executemany(
+            'INSERT OR REPLACE INTO extractor_state (key, value) VALUES (?, ?)',
+            [(key, str(value)) for key, value in entries.items()]
+        )
+        
+        conn.commit()
+        if not incremental:
+            cursor.execute('PRAGMA journal_mode = DELETE')
+            conn.close()
+            backup_path = os.path.join(SCRIPT_DIR, config['output'].get('backup_db', 'ioc_cache_yesterday.db'))
+            swap_cache_db(build_path, db_path, backup_path, config)
+        logger.info(f"Successfully saved {count} IOCs to cache database {db_path}")
+        
+    except Exception as e:
+        logger.error(f"Error saving IOCs to cache database {db_path}: {e}")
+        count = None
+        if build_path != db_path and os.path.exists(build_path):
+            os.remove(build_path)
+    finally:
+        if 'conn' in locals():
+            conn.close()
+            
+    return count
+
+
+def write_bloom_filter(db_path=None, bloom_path=None, fp_rate=None, config=None):
+    """
+    Write a bloom filter over the canonical values of all IOCs next to the cache.
+    
+    Args:
+        db_path: Path to the SQLite database file (None will use config value)
+        bloom_path: Path to the filter file (None will use config value)
+        fp_rate: Target false-positive rate (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+        
+    Returns:
+        bool: True if the filter was written
+    """
+    if config is None:
+        config = get_config()
+    
+    if db_path is None:
+        db_path = os.path.join(SCRIPT_DIR, config['output']['cache_db'])
+    if bloom_path is None:
+        bloom_path = os.path.join(SCRIPT_DIR, config['output']['bloom_filter'])
+    if fp_rate is None:
+        fp_rate = config['output'].get('bloom_fp_rate', 0.001)
+    
+    try:
+        import sqlite3
+        from ioc_lookup import BloomFilter
+        conn = sqlite3.connect(db_path)
+        try:
+            # Read the generation and the values from the same snapshot
+            conn.execute('BEGIN')
+            generation = conn.execute(
+                "SELECT value FROM extractor_state WHERE key = 'cache_generation'").fetchone()[0]
+            count = conn.execute('SELECT COUNT(DISTINCT canonical_value) FROM attributes').fetchone()[0]
+            bloom = BloomFilter.create(count, fp_rate, generation)
+            for (value,) in conn.execute('SELECT DISTINCT canonical_value FROM attributes'):
+                if value is not None:
+                    bloom.add(value)
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        bloom.save(bloom_path)
+        logger.info(f"Saved bloom filter over {count} IOC values to {bloom_path} "
+                    f"({bloom.num_bits // 8} bytes, {bloom.num_hashes} hashes)")
+        return True
+    except Exception as e:
+        logger.error(f"Error writing bloom filter {bloom_path}: {e}")
+        return False
+
+
+def write_pattern_matcher(db_path=None, pattern_path=None, min_length=None, config=None):
+    """
+    Compile the url, filename and mutex IOCs into a substring matcher file.
+    
+    Args:
+        db_path: Path to the SQLite database file (None will use config value)
+        pattern_path: Path to the matcher file (None will use config value)
+        min_length: Shortest value compiled into the matcher; shorter values
+            would match almost any text (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+        
+    Returns:
+        bool: True if the matcher was written
+    """
+    if config is None:
+        config = get_config()
+    
+    if db_path is None:
+        db_path = os.path.join(SCRIPT_DIR, config['output']['cache_db'])
+    if pattern_path is None:
+        pattern_path = os.path.join(SCRIPT_DIR, config['output']['pattern_file'])
+    if min_length is None:
+        min_length = config['output'].get('pattern_min_length', 4)
+    
+    try:
+        import sqlite3
+        from ioc_lookup import PATTERN_ATTRIBUTE_TYPES, PatternMatcher
+        conn = sqlite3.connect(db_path)
+        try:
+            # Read the generation and the values from the same snapshot
+            conn.execute('BEGIN')
+            generation = conn.execute(
+                "SELECT value FROM extractor_state WHERE key = 'cache_generation'").fetchone()[0]
+            rows = conn.execute(
+                'SELECT canonical_value, attribute_id FROM attributes '
+                'WHERE attribute_type IN ({}) AND length(canonical_value) >= ?'.format(
+                    ','.join('?' * len(PATTERN_ATTRIBUTE_TYPES))),
+                PATTERN_ATTRIBUTE_TYPES + (min_length,))
+            matcher = PatternMatcher.build(rows, generation=generation)
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        matcher.save(pattern_path)
+        logger.info(f"Saved pattern matcher over {len(matcher)} IOC values to {pattern_path} "
+                    f"({matcher.num_states} states)")
+        return True
+    except Exception as e:
+        logger.error(f"Error writing pattern matcher {pattern_path}: {e}")
+        return False
+
+
+def write_cache_sidecars(db_path=None, config=None):
+    """
+    Regenerate the lookup files derived from the cache database.
+    
+    Args:
+        db_path: Path to the SQLite database file (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+    """
+    if config is None:
+        config = get_config()
+    
+    if db_path is None:
+        db_path = os.path.join(SCRIPT_DIR, config['output']['cache_db'])
+    if config['output'].get('bloom_filter'):
+        write_bloom_filter(db_path, config=config)
+    if config['output'].get('pattern_file'):
+        write_pattern_matcher(db_path, config=config)
+
+
+# MISP tables whose row changes are followed in the binlog
+BINLOG_TABLES = ('attributes', 'events')
+
+
+def current_binlog_position(connection):
+    """
+    Get the current end of the MISP server's binary log.
+    
+    Args:
+        connection: MySQL connection object
+        
+    Returns:
+        tuple: (log file, position), or None if binary logging is off
+    """
+    from mysql.connector import Error
+    
+    cursor = connection.cursor()
+    try:
+        # MySQL 8.4 renamed SHOW MASTER STATUS
+        for statement in ('SHOW MASTER STATUS', 'SHOW BINARY LOG STATUS'):
+            try:
+                cursor.execute(statement)
+                row = cursor.fetchone()
+                return (row[0], int(row[1])) if row else None
+            except Error:
+                continue
+        return None
+    finally:
+        cursor.close()
+
+
+def iter_binlog_changes(log_file, log_pos, server_id=None, heartbeat=None, config=None):
+    """
+    Stream the row changes on MISP's attributes and events tables from the binlog.
+    
+    The MISP server must write row-based binlogs (binlog_format=ROW with
+    binlog_row_image=FULL) and the configured user needs the REPLICATION
+    SLAVE and REPLICATION CLIENT privileges. Requires pymysqlreplication.
+    
+    Every row change is normalised into a dictionary with the table name,
+    action ('insert', 'update' or 'delete') and row (the values after an
+    insert or update, or before a delete). A 'commit' dictionary carrying
+    log_file and log_pos follows the changes of each transaction, and a
+    'heartbeat' dictionary is yielded while the server is idle.
+    
+    Args:
+        log_file: Binlog file to start reading from
+        log_pos: Position in log_file to start reading from
+        server_id: Replica server id, unique among the replicas of the
+            MISP server (None will use config value)
+        heartbeat: Seconds between heartbeats from an idle server
+            (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+        
+    Yields:
+        dict: Row change, commit or heartbeat
+    """
+    from pymysqlreplication import BinLogStreamReader
+    from pymysqlreplication.event import HeartbeatLogEvent, XidEvent
+    from pymysqlreplication.row_event import DeleteRowsEvent, UpdateRowsEvent, WriteRowsEvent
+    
+    if config is None:
+        config = get_config()
+    binlog_config = config.get('binlog', {})
+    
+    if server_id is None:
+        server_id = binlog_config.get('server_id', 4711)
+    if heartbeat is None:
+        heartbeat = binlog_config.get('heartbeat_seconds', 1)
+    database = config['database']
+    connection_settings = {key: database[key] for key in ('host', 'port', 'user', 'password') if key in database}
+    actions = {WriteRowsEvent: 'insert', UpdateRowsEvent: 'update', DeleteRowsEvent: 'delete'}
+    
+    logger.info(f"Following the binlog from {log_file}:{log_pos}")
+    stream = BinLogStreamReader(
+        connection_settings=connection_settings,
+        server_id=server_id,
+        only_events=[WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent, XidEvent, HeartbeatLogEvent],
+        only_schemas=[database.get('database', 'misp')],
+        only_tables=list(BINLOG_TABLES),
+        log_file=log_file,
+        log_pos=log_pos,
+        resume_stream=True,
+        blocking=True,
+        slave_heartbeat=heartbeat,
+    )
+    try:
+        for binlog_event in stream:
+            if isinstance(binlog_event, XidEvent):
+                yield {'action': 'commit', 'log_file': stream.log_file, 'log_pos': stream.log_pos}
+            elif isinstance(binlog_event, HeartbeatLogEvent):
+                yield {'action': 'heartbeat'}
+            else:
+                action = actions[type(binlog_event)]
+                values_key = 'after_values' if action == 'update' else 'values'
+                for row in binlog_event.rows:
+                    values = {
+                        column: value.decode('utf-8', 'replace') if isinstance(value, bytes) else value
+                        for column, value in row[values_key].items()
+                    }
+                    yield {'table': binlog_event.table, 'action': action, 'row': values}
+    finally:
+        stream.close()
+
+
+def record_binlog_changes(changes, record_path):
+    """
+    Append binlog changes to a newline-delimited JSON file as they pass through.
+    
+    The recording can be applied again with iter_recorded_changes, to
+    replay a stretch of MISP activity against a cache without a server.
+    
+    Args:
+        changes: Iterable of change dictionaries from iter_binlog_changes
+        record_path: Path to the recording
+        
+    Yields:
+        dict: The same change dictionaries
+    """
+    with open(record_path, 'a', encoding='utf-8') as f:
+        for change in changes:
+            if change['action'] != 'heartbeat':
+                f.write(json.dumps(change, default=json_default) + '\n')
+                if change['action'] == 'commit':
+                    f.flush()
+            yield change
+
+
+def iter_recorded_changes(record_path):
+    """
+    Read the binlog changes recorded by record_binlog_changes.
+    
+    Args:
+        record_path: Path to the recording
+        
+    Yields:
+        dict: Change dictionary
+    """
+    with open(record_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def lookup_binlog_events(cursor, connection, event_ids, events):
+    """
+    Find the event columns of the IOCs built from binlog attribute rows.
+    
+    Events changed in the same batch are taken from the batch, the others
+    from the cache, and events the cache does not hold yet are read from
+    MISP by primary key. Each event also carries event_published for
+    ioc_row_converter; events in the cache count as published, since the
+    IOCs of unpublished events are not kept there with published_only.
+    
+    Args:
+        cursor: SQLite cursor on the cache database
+        connection: MySQL connection object, or None to only use the cache
+        event_ids: Set of event ids
+        events: Dictionary of event rows from the binlog, by event id
+        
+    Returns:
+        dict: Event columns of an IOC row, by event id
+    """
+    found = {}
+    for event_id in event_ids & events.keys():
+        row = events[event_id]
+        found[event_id] = format_ioc_row({
+            'event_id': row['id'],
+            'event_uuid': row['uuid'],
+            'event_info': row['info'],
+            'event_date': row['date'],
+            'event_timestamp': row['timestamp'],
+            'event_published': row.get('published', 1),
+        })
+    
+    missing = list(event_ids - found.keys())
+    for start in range(0, len(missing), ID_CHUNK_SIZE):
+        chunk = missing[start:start + ID_CHUNK_SIZE]
+        cursor.execute(f'''
+            SELECT event_id, event_uuid, event_info, event_date, event_timestamp
+            FROM events WHERE event_id IN ({','.join('?' * len(chunk))})
+            ''', chunk)
+        for row in cursor.fetchall():
+            found[row[0]] = dict(zip(EVENT_COLUMNS, row), event_published=1)
+    
+    missing = list(event_ids - found.keys())
+    if missing and connection is not None:
+        if not connection.is_connected():
+            connection.reconnect()
+        mysql_cursor = connection.cursor(dictionary=True)
+        try:
+            mysql_cursor.execute(f'''
+                SELECT id as event_id, uuid as event_uuid, info as event_info,
+                    date as event_date, timestamp as event_timestamp, published as event_published
+                FROM events WHERE id IN ({','.join(['%s'] * len(missing))})
+                ''', missing)
+            for row in mysql_cursor.fetchall():
+                found[row['event_id']] = format_ioc_row(row)
+            connection.commit()
+        finally:
+            mysql_cursor.close()
+    return found
+
+
+def fetch_event_iocs(connection, event_ids, convert, config=None):
+    """
+    Read the IOCs of whole events from MISP.
+    
+    Args:
+        connection: MySQL connection object
+        event_ids: List of event ids
+        convert: Function from ioc_row_converter
+        config: Configuration dictionary (None will use get_config())
+        
+    Returns:
+        list: IOC dictionaries and tombstones
+    """
+    if config is None:
+        config = get_config()
+    
+    ioc_types = config['extraction']['ioc_types']
+    if not connection.is_connected():
+        connection.reconnect()
+    iocs = []
+    cursor = connection.cursor(dictionary=True)
+    try:
+        for start in range(0, len(event_ids), ID_CHUNK_SIZE):
+            chunk = event_ids[start:start + ID_CHUNK_SIZE]
+            cursor.execute(IOC_QUERY + """
+            WHERE
+                a.type IN ({})
+                AND a.event_id IN ({})
+            """.format(','.join(['%s'] * len(ioc_types)), ','.join(['%s'] * len(chunk))),
+                list(ioc_types) + chunk)
+            iocs.extend(convert(row) for row in cursor.fetchall())
+        connection.commit()
+    finally:
+        cursor.close()
+    return iocs
+
+
+def write_binlog_batch(changes, position, db_path=None, connection=None, expire=False, config=None):
+    """
+    Apply a batch of binlog row changes to the cache in one transaction.
+    
+    Attribute inserts and updates are upserted like the IOCs of an
+    incremental run, and the same attributes are not extracted, see
+    ioc_row_converter. Deleted attributes, attributes that are no longer
+    extracted and attributes whose type is not extracted are deleted from
+    the cache, as are the IOCs of deleted events. Event updates are applied
+    to events already in the cache. With extraction.published_only the
+    IOCs of unpublished events are deleted, and the IOCs of newly published
+    events are read from MISP if a connection is given. The binlog position
+    is stored in the same transaction, so the cache never holds a change
+    without its checkpoint or the other way round.
+    
+    Args:
+        changes: List of row change dictionaries from iter_binlog_changes
+        position: (log file, position) reached after the batch
+        db_path: Path to the SQLite database file (None will use config value)
+        connection: MySQL connection for events the cache does not hold
+            (optional)
+        expire: Also expire IOCs older than output.retention_hours
+        config: Configuration dictionary (None will use get_config())
+        
+    Returns:
+        int: Number of IOCs upserted, deleted or expired; the cache
+            generation is only changed if it is not 0
+        
+    Raises:
+        Exception: If the batch could not be applied; the cache and its
+            checkpoint are left unchanged
+    """
+    import sqlite3
+    import uuid
+    
+    if config is None:
+        config = get_config()
+    
+    if db_path is None:
+        db_path = os.path.join(SCRIPT_DIR, config['output']['cache_db'])
+    ioc_types = set(config['extraction']['ioc_types'])
+    published_only = config['extraction'].get('published_only', False)
+    convert = ioc_row_converter(config)
+    
+    # Collapse the batch to the last change of every row
+    events = {}
+    deleted_events = set()
+    upserts = {}
+    deletes = set()
+    for change in changes:
+        row = change['row']
+        if change['table'] == 'events':
+            if change['action'] == 'delete':
+                events.pop(row['id'], None)
+                deleted_events.add(row['id'])
+            else:
+                events[row['id']] = row
+                deleted_events.discard(row['id'])
+        elif change['action'] == 'delete' or row.get('deleted') or row['type'] not in ioc_types:
+            upserts.pop(row['id'], None)
+            deletes.add(row['id'])
+        else:
+            upserts[row['id']] = row
+            deletes.discard(row['id'])
+    
+    count = 0
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        pragmas = dict(INCREMENTAL_PRAGMAS)
+        pragmas.update(config['output'].get('sqlite_pragmas', {}))
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        create_cache_schema(cursor)
+        create_cache_indexes(cursor)
+        
+        iocs = []
+        if events:
+            event_rows = lookup_binlog_events(cursor, None, set(events), events)
+            cursor.executemany('''
+                UPDATE events SET event_uuid = ?, event_info = ?, event_date = ?, event_timestamp = ?
+                WHERE event_id = ?
+                ''', [operator.itemgetter(*EVENT_COLUMNS[1:], 'event_id')(event) for event in event_rows.values()])
+            
+            if published_only:
+                published_ids = []
+                for event_id, row in events.items():
+                    if not row.get('published', 1):
+                        iocs.append({'attribute_id': None, 'event_id': event_id, 'tombstone': True})
+                    elif not cursor.execute('SELECT 1 FROM events WHERE event_id = ?', (event_id,)).fetchone():
+                        published_ids.append(event_id)
+                if published_ids and connection is not None:
+                    iocs.extend(fetch_event_iocs(connection, published_ids, convert, config))
+        
+        if deletes:
+            count += delete_cache_rows(cursor, deletes)
+        
+        if upserts:
+            event_rows = lookup_binlog_events(
+                cursor, connection, {row['event_id'] for row in upserts.values()}, events)
+            for row in upserts.values():
+                event = event_rows.get(row['event_id'])
+                if event is None:
+                    logger.warning(f"Deleting attribute {row['id']}: event {row['event_id']} not found")
+                    iocs.append({'attribute_id': row['id'], 'event_id': row['event_id'], 'tombstone': True})
+                    continue
+                ioc = dict(event)
+                ioc.update({
+                    'attribute_id': row['id'],
+                    'attribute_type': row['type'],
+                    'attribute_category': row['category'],
+                    'attribute_value': row['value1'],
+                    'attribute_timestamp': row['timestamp'],
+                    'attribute_comment': row['comment'],
+                    'attribute_to_ids': row['to_ids'],
+                    'attribute_deleted': row.get('deleted', 0),
+                    'attribute_disable_correlation': row.get('disable_correlation', 0),
+                })
+                iocs.append(convert(ioc))
+        
+        entries = {}
+        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if iocs:
+            count += delete_tombstones(cursor, [ioc for ioc in iocs if 'tombstone' in ioc])
+            count += load_cache_rows(
+                cursor, [ioc for ioc in iocs if 'tombstone' not in ioc], current_time, incremental=True, config=config)
+        
+        # Tagging an event only updates its row, so updated events are
+        # enriched again even if none of their attributes changed
+        if (iocs or events) and connection is not None and config['extraction'].get('enrichment', True):
+            entries.update(load_enrichment_rows(
+                cursor, connection, current_time, event_ids=list(events), config=config) or {})
+        
+        if deleted_events:
+            count += delete_cache_events(cursor, deleted_events)
+        
+        if expire:
+            retention_hours = config['output'].get('retention_hours', config['extraction']['hours_lookback'])
+            if retention_hours:
+                count += expire_cache_rows(cursor, retention_hours)
+        
+        # Commits of unrelated tables end up here as empty batches; only
+        # their checkpoint is stored, so readers keep their derived data
+        entries.update({
+            'schema_version': SCHEMA_VERSION,
+            'binlog_file': position[0],
+            'binlog_position': position[1],
+        })
+        if count:
+            entries['cache_generation'] = uuid.uuid4().hex
+        cursor.executemany(
+            'INSERT OR REPLACE INTO extractor_state (key, value) VALUES (?, ?)',
+            [(key, str(value)) for key, value in entries.items()]
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return count
+
+
+def apply_binlog_changes(changes, db_path=None, connection=None, stop=None, batch_size=None, flush_seconds=None,
+                         config=None):
+    """
+    Apply a stream of binlog changes to the cache in batches.
+    
+    Only whole transactions are applied: the changes are written when a
+    commit completes a batch of batch_size changes, when flush_seconds
+    passed since the last write, on a heartbeat from the idle server and
+    before stopping.
+    Old IOCs are expired, and the lookup sidecars regenerated if the cache
+    changed, at most every binlog.sidecar_interval_seconds.
+    
+    Args:
+        changes: Iterable of change dictionaries, from iter_binlog_changes
+            or iter_recorded_changes
+        db_path: Path to the SQLite database file (None will use config value)
+        connection: MySQL connection for events the cache does not hold
+            (optional)
+        stop: threading.Event that ends the stream after the next write
+            (optional)
+        batch_size: Number of changes per transaction (None will use config value)
+        flush_seconds: Maximum seconds a committed change waits before it
+            is written (None will use config value)
+        config: Configuration dictionary (None will use get_config())
+        
+    Returns:
+        int: Number of IOCs upserted or deleted
+    """
+    if config is None:
+        config = get_config()
+    binlog_config = config.get('binlog', {})
+    
+    if db_path is None:
+        db_path = os.path.join(SCRIPT_DIR, config['output']['cache_db'])
+    if batch_size is None:
+        batch_size = binlog_config.get('batch_size', 1000)
+    if flush_seconds is None:
+        flush_seconds = binlog_config.get('flush_seconds', 1)
+    sidecar_interval = binlog_config.get('sidecar_interval_seconds', 60)
+    
+    pending = []
+    committed = 0
+    position = None
+    count = 0
+    dirty = False
+    last_write = last_maintenance = time.monotonic()
+    
+    for change in itertools.chain(changes, [None]):
+        action = change['action'] if change else 'end'
+        if action == 'commit':
+            committed = len(pending)
+            position = (change['log_file'], change['log_pos'])
+        elif action not in ('heartbeat', 'end'):
+            pending.append(change)
+            continue
+        
+        now = time.monotonic()
+        stopping = action == 'end' or (stop is not None and stop.is_set())
+        if position is not None and (stopping or action == 'heartbeat' or committed >= batch_size
+                                     or now - last_write >= flush_seconds):
+            maintain = now - last_maintenance >= sidecar_interval
+            written = write_binlog_batch(pending[:committed], position, db_path, connection, expire=maintain,
+                                         config=config)
+            if written:
+                logger.info(f"Applied {written} IOC changes to the cache up to binlog {position[0]}:{position[1]}")
+            count += written
+            dirty = dirty or bool(written)
+            del pending[:committed]
+            committed = 0
+            position = None
+            last_write = now
+            if maintain:
+                last_maintenance = now
+                if dirty:
+                    write_cache_sidecars(db_path, config)
+                    dirty = False
+        
+        if stopping:
+            break
+    
+    if pending:
+        logger.warning(f"Discarding {len(pending)} binlog changes of an unfinished transaction")
+    if dirty:
+        write_cache_sidecars(db_path, config)
+    return count
+
+
+class Extractor:
+    """
+    One configured IOC extraction from MISP into the JSON file and cache.
+    
+    The extractor passes its configuration explicitly to every extraction
+    and output function it calls and never changes the default returned
+    by get_config(), so extractors and workers with different
+    configurations can run side by side in one process. It is the entry
+    point for library callers and the command line alike.
+    
+    An Extractor keeps its connection pool and the incremental watermark
+    between runs, so run_forever() can extract every few seconds without
+    reconnecting or rereading the cache state, and records statistics
+    about its runs in stats. The lookup sidecars are regenerated after
+    every run that changed the cache, or at most every sidecar_interval
+    seconds if it is set.
+    """
+    
+    def __init__(self, config=None, config_path=None):
+        """
+        Args:
+            config: Configuration dictionary (optional)
+            config_path: Path to a configuration file, read if config is
+                not given (None will use misp_db_config.json)
+        """
+        self.config = config if config is not None else load_config(config_path)
+        self.pool = None
+        self.keep_pool = False
+        self.cache_state = None
+        self.sidecar_interval = None
+        self._sidecars_dirty = False
+        self._sidecars_written = None
+        self.stats = {
+            'runs': 0,
+            'failed_runs': 0,
+            'total_iocs': 0,
+            'last_run_started': None,
+            'last_run_seconds': None,
+            'last_run_iocs': None,
+            'last_success': None,
+            'last_error': None,
+            'watermark_timestamp': None,
+        }
+        self._stop = threading.Event()
+    
+    def connect(self):
+        """
+        Connect to the MISP database.
+        
+        Parallel extraction draws one extra connection per shard from a pool.
+        The pool is created on first use and kept for later runs, as is a
+        pool requested with keep_pool.
+        
+        Returns:
+            tuple: (connection or None if connecting failed, pool or None)
+        """
+        parallelism = self.config['extraction'].get('parallelism', 1)
+        if parallelism > 1 or self.keep_pool:
+            if self.pool is None:
+                self.pool = create_connection_pool(parallelism + 1, self.config)
+            return (self.pool.get_connection() if self.pool else None), self.pool
+        return connect_to_db(self.config), None
+    
+    def run(self, resume_after_id=None):
+        """
+        Extract the IOCs and write the JSON file, cache database and sidecars.
+        
+        Args:
+            resume_after_id: Attribute id a paginated extraction resumes after
+                (None will use config value)
+        
+        Returns:
+            int: Number of IOCs saved or deleted, or None if the MISP
+                database could not be reached or the cache not be written
+        """
+        config = self.config
+        connection = None
+        count = 0
+        started = time.monotonic()
+        self.stats['last_run_started'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        error = None
+        try:
+            connection, pool = self.connect()
+            if not connection:
+                logger.error("Failed to connect to database.")
+                error = "Failed to connect to database"
+                count = None
+                return None
+            
+            # Fetch the recent IOCs
+            db_path = os.path.join(SCRIPT_DIR, config['output']['cache_db'])
+            incremental_extraction = config['extraction'].get('mode', 'window') == 'incremental'
+            incremental = incremental_extraction or config['output'].get('cache_mode', 'rebuild') == 'incremental'
+            
+            # A paginated walk that fails part way only keeps its rows in a
+            # cache updated in place, and a resumed walk only reads the rows
+            # after the given id, so it can never rebuild the cache
+            keep_partial = False
+            if config['extraction'].get('mode', 'window') == 'paginated':
+                up_to_date = load_cache_state(db_path).get('schema_version') == SCHEMA_VERSION
+                if resume_after_id or config['extraction'].get('start_after_id'):
+                    if not up_to_date:
+                        logger.error(f"Cannot resume the extraction: {db_path} is missing or uses an older layout")
+                        error = "Cannot resume the extraction without a current cache"
+                        count = None
+                        return None
+                    if not incremental:
+                        logger.warning("A resumed extraction updates the cache in place instead of rebuilding it")
+                        incremental = True
+                keep_partial = incremental and up_to_date
+            
+            if not incremental_extraction:
+                hours_lookback = config['extraction']['hours_lookback']
+                logger.info(f"Fetching IOCs from the last {hours_lookback} hours")
+            elif self.cache_state is None:
+                self.cache_state = load_cache_state(db_path)
+            state = {}
+            iocs = iter_iocs(connection, db_path, state, pool, resume_after_id, self.cache_state, keep_partial,
+                             config)
+            # The overlap re-reads rows an up-to-date cache already holds
+            cache_current = incremental_extraction and self.cache_state.get('schema_version') == SCHEMA_VERSION
+            if cache_current:
+                iocs = skip_unchanged_iocs(iocs, db_path)
+            
+            # Peek at the first row so an empty window leaves the outputs untouched
+            first_ioc = next(iocs, None)
+            if first_ioc is None and incremental_extraction:
+                logger.info("No IOCs changed since the last run")
+                # Tagging an event changes none of its attributes, so the
+                # enrichment of an up-to-date cache is still refreshed
+                if cache_current and config['extraction'].get('enrichment', True):
+                    if save_to_cache_db(iter(()), db_path, incremental=True, connection=connection,
+                                        config=config) is None:
+                        error = "Error saving IOCs to cache database"
+            elif first_ioc is None:
+                logger.warning("No IOCs found in the specified time period")
+            else:
+                iocs = canonicalize_iocs(itertools.chain([first_ioc], iocs))
+                
+                # Stream to the JSON file on the way into the cache database
+                json_path = os.path.join(SCRIPT_DIR, config['output']['json_file'])
+                iocs = stream_to_json(iocs, json_path, config=config)
+                parquet_file = config['output'].get('parquet_file')
+                if parquet_file:
+                    iocs = stream_to_parquet(iocs, os.path.join(SCRIPT_DIR, parquet_file), config=config)
+                
+                # Save to cache database
+                count = save_to_cache_db(iocs, db_path, incremental=incremental, state=state, connection=connection,
+                                         config=config)
+                if count is None:
+                    error = "Error saving IOCs to cache database"
+                else:
+                    # The count includes deleted IOCs, so a run that only
+                    # deleted some still refreshes the sidecars
+                    if count:
+                        self._sidecars_dirty = True
+                    # The cache now holds this run's watermark, even if
+                    # nothing in it changed
+                    if incremental_extraction and state:
+                        self.cache_state = dict(self.cache_state or {}, schema_version=SCHEMA_VERSION, **state)
+                    logger.info(f"Process completed successfully. Retrieved {count} IOCs.")
+            
+            self.write_sidecars()
+                
+        except Exception as e:
+            logger.error(f"An unexpected error occurred: {e}")
+            error = str(e)
+        finally:
+            # Close the database connection; a pooled connection goes back to the pool
+            if connection and connection.is_connected():
+                connection.close()
+                logger.info("Database connection closed")
+            self.record_run(count, error, time.monotonic() - started)
+        return count
+    
+    def write_sidecars(self, force=False):
+        """
+        Regenerate the lookup sidecars if the cache changed since they were written.
+        
+        With sidecar_interval set, they are regenerated at most that often,
+        since rebuilding them reads the whole cache.
+        
+        Args:
+            force: Regenerate changed sidecars even if the interval has not passed
+        """
+        if not self._sidecars_dirty:
+            return
+        now = time.monotonic()
+        if (not force and self.sidecar_interval and self._sidecars_written is not None
+                and now - self._sidecars_written < self.sidecar_interval):
+            return
+        write_cache_sidecars(os.path.join(SCRIPT_DIR, self.config['output']['cache_db']), self.config)
+        self._sidecars_dirty = False
+        self._sidecars_written = now
+    
+    def record_run(self, count, error, seconds):
+        """
+        Update the run statistics.
+        
+        Args:
+            count: Number of IOCs saved, None if the run failed
+            error: Error message of a failed run, or None
+            seconds: Duration of the run in seconds
+        """
+        stats = self.stats
+        stats['runs'] += 1
+        stats['last_run_seconds'] = round(seconds, 3)
+        stats['last_run_iocs'] = count
+        if error:
+            stats['failed_runs'] += 1
+            stats['last_error'] = error
+        else:
+            stats['last_success'] = stats['last_run_started']
+            stats['total_iocs'] += count or 0
+        if self.cache_state and 'watermark_timestamp' in self.cache_state:
+            stats['watermark_timestamp'] = int(self.cache_state['watermark_timestamp'])
+    
+    def write_stats(self, stats_path=None):
+        """
+        Write the run statistics to a JSON file, replacing it atomically.
+        
+        Args:
+            stats_path: Path to the statistics file (None will use config value)
+        """
+        if stats_path is None:
+            stats_file = self.config.get('daemon', {}).get('stats_file')
+            if not stats_file:
+                return
+            stats_path = os.path.join(SCRIPT_DIR, stats_file)
+        
+        try:
+            tmp_path = stats_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.stats, f, indent=2)
+            os.replace(tmp_path, stats_path)
+        except Exception as e:
+            logger.error(f"Error writing run statistics to {stats_path}: {e}")
+    
+    def run_forever(self, interval=None):
+        """
+        Run incremental extractions on a fixed interval until stop() is called.
+        
+        The connection pool and watermark stay warm between runs. A run that
+        takes longer than the interval is followed by the next one straight
+        away; a run that fails, for instance because MySQL is down, is
+        retried on the next tick. The lookup sidecars are regenerated after
+        every run that changed IOCs, or with daemon.sidecar_interval_seconds
+        set at most that often and once more on stop.
+        
+        Args:
+            interval: Seconds between the start of two runs (None will use
+                config value)
+        """
+        if interval is None:
+            interval = self.config.get('daemon', {}).get('interval_seconds', 60)
+        if self.config['extraction'].get('mode', 'window') != 'incremental':
+            logger.warning("Daemon mode always uses the incremental extraction mode")
+            self.config = dict(self.config, extraction=dict(self.config['extraction'], mode='incremental'))
+        self.keep_pool = True
+        self.sidecar_interval = self.config.get('daemon', {}).get('sidecar_interval_seconds', 0)
+        
+        logger.info(f"Extracting IOCs every {interval} seconds")
+        self._stop.clear()
+        try:
+            while not self._stop.is_set():
+                started = time.monotonic()
+                self.run()
+                self.write_stats()
+                self._stop.wait(max(0, interval - (time.monotonic() - started)))
+        finally:
+            self.write_sidecars(force=True)
+            self.sidecar_interval = None
+        logger.info(f"Daemon stopped after {self.stats['runs']} runs")
+    
+    def follow_binlog(self, retry_seconds=None):
+        """
+        Apply MISP's binlog to the cache until stop() is called.
+        
+        A cache without a binlog checkpoint is first built by a regular
+        run, after noting the binlog position so the changes made during
+        that run are applied afterwards. From then on every committed
+        change to attributes and events reaches the cache within about
+        binlog.flush_seconds, without querying MISP's tables. If the
+        stream fails it is resumed from the checkpoint in the cache.
+        
+        Args:
+            retry_seconds: Seconds to wait before resuming a failed stream
+                (None will use config value)
+        """
+        binlog_config = self.config.get('binlog', {})
+        if retry_seconds is None:
+            retry_seconds = binlog_config.get('retry_seconds', 10)
+        db_path = os.path.join(SCRIPT_DIR, self.config['output']['cache_db'])
+        
+        self._stop.clear()
+        connection = None
+        try:
+            while not self._stop.is_set():
+                try:
+                    if connection is None or not connection.is_connected():
+                        connection = connect_to_db(self.config)
+                        if not connection:
+                            raise RuntimeError("Failed to connect to database")
+                    
+                    cache_state = load_cache_state(db_path)
+                    if cache_state.get('schema_version') != SCHEMA_VERSION or 'binlog_file' not in cache_state:
+                        position = current_binlog_position(connection)
+                        if position is None:
+                            raise RuntimeError("Binary logging is not enabled on the MISP database")
+                        logger.info(f"Building the cache before following the binlog from {position[0]}:{position[1]}")
+                        if self.run() is None:
+                            raise RuntimeError("Initial extraction failed")
+                        write_binlog_batch([], position, db_path, config=self.config)
+                        cache_state = load_cache_state(db_path)
+                    
+                    changes = iter_binlog_changes(cache_state['binlog_file'], int(cache_state['binlog_position']),
+                                                  config=self.config)
+                    record_file = binlog_config.get('record_file')
+                    if record_file:
+                        changes = record_binlog_changes(changes, os.path.join(SCRIPT_DIR, record_file))
+                    try:
+                        apply_binlog_changes(changes, db_path, connection, stop=self._stop, config=self.config)
+                    finally:
+                        changes.close()
+                except Exception as e:
+                    logger.error(f"Error following the binlog: {e}")
+                    self._stop.wait(retry_seconds)
+        finally:
+            if connection and connection.is_connected():
+                connection.close()
+                logger.info("Database connection closed")
+        logger.info("Stopped following the binlog")
+    
+    def replay_binlog(self, record_path):
+        """
+        Apply binlog changes recorded with binlog.record_file to the cache.
+        
+        Events the cache does not hold are only taken from the recording,
+        so no MISP database is needed.
+        
+        Args:
+            record_path: Path to the recording
+            
+        Returns:
+            int: Number of IOCs upserted or deleted, or None if the
+                recording could not be applied
+        """
+        try:
+            count = apply_binlog_changes(iter_recorded_changes(record_path), config=self.config)
+            logger.info(f"Replayed {record_path}: {count} IOC changes applied")
+            return count
+        except Exception as e:
+            logger.error(f"Error replaying binlog changes from {record_path}: {e}")
+            return None
+    
+    def stop(self):
+        """
+        Ask run_forever() or follow_binlog() to return once the current run
+        or batch has finished.
+        """
+        self._stop.set()
+
+
+def main(argv=None):
+    """
+    Command line entry point.
+    
+    Args:
+        argv: Command line arguments (None will use sys.argv)
+    """
+    import argparse
+    import signal
+    
+    parser = argparse.ArgumentParser(description='Extract IOCs from MISP database')
+    parser.add_argument('--config', help='Path to configuration file')
+    parser.add_argument('--resume-after-id', type=int,
+                        help='Resume a paginated extraction after this attribute id')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep running and extract incrementally on an interval')
+    parser.add_argument('--interval', type=float,
+                        help='Seconds between daemon runs (default: daemon.interval_seconds)')
+    parser.add_argument('--binlog', action='store_true',
+                        help='Keep running and apply changes from the MISP binlog to the cache')
+    parser.add_argument('--replay-binlog', metavar='FILE',
+                        help='Apply binlog changes recorded with binlog.record_file to the cache')
+    args = parser.parse_args(argv)
+    
+    configure_logging()
+    extractor = Extractor(config_path=args.config)
+    if args.replay_binlog:
+        if extractor.replay_binlog(args.replay_binlog) is None:
+            sys.exit(1)
+        return
+    if args.daemon or args.binlog:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: extractor.stop())
+        if args.binlog:
+            extractor.follow_binlog()
+        else:
+            extractor.run_forever(args.interval)
+        return
+    if extractor.run(resume_after_id=args.resume_after_id) is None:
+        logger.error("Exiting.")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,10 +1,22 @@
 #!/bin/bash
 # This script sets up daily cron jobs to run MISP feed fetching and the MISP DB IOC extractor
+#
+# Usage: bash setup_daily_extractor.sh [--daemon]
+#
+# With --daemon the extractor is installed as a systemd service that extracts
+# incremental changes continuously, instead of as a daily cron job.
 
 # Get the absolute path to the script directory
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 EXTRACTOR_SCRIPT="$SCRIPT_DIR/misp_db_extractor.py"
 CONFIG_FILE="$SCRIPT_DIR/misp_api_config.json"
+SERVICE_NAME="misp-ioc-extractor"
+SERVICE_FILE="/etc/systemd/system/$SERVICE_NAME.service"
+
+DAEMON_MODE=0
+if [ "$1" = "--daemon" ]; then
+    DAEMON_MODE=1
+fi
 
 # Make the extractor script executable
 chmod +x "$EXTRACTOR_SCRIPT"
@@ -44,7 +56,14 @@ else
 fi
 
 # Check if the extractor entry already exists
-if ! grep -q "misp_db_extractor.py" "$TEMP_CRON"; then
+if [ "$DAEMON_MODE" = "1" ]; then
+    if grep -q "misp_db_extractor.py" "$TEMP_CRON"; then
+        # The daemon replaces the cron job; both must not update the cache
+        grep -v "misp_db_extractor.py\|Daily MISP IOC extraction" "$TEMP_CRON" > "$TEMP_CRON.new"
+        mv "$TEMP_CRON.new" "$TEMP_CRON"
+        echo "Removed the IOC extractor cron job in favour of the daemon."
+    fi
+elif ! grep -q "misp_db_extractor.py" "$TEMP_CRON"; then
     # Add the extraction cron job - run daily at 2AM
     echo "# ThreatIntel Co-Pilot: Daily MISP IOC extraction" >> "$TEMP_CRON"
     echo "0 2 * * * cd $SCRIPT_DIR && python3 $EXTRACTOR_SCRIPT >> $SCRIPT_DIR/cron_extract.log 2>&1" >> "$TEMP_CRON"
@@ -59,6 +78,34 @@ crontab "$TEMP_CRON"
 # Clean up
 rm "$TEMP_CRON"
 
+# Install the extractor daemon as a systemd service
+if [ "$DAEMON_MODE" = "1" ]; then
+    SERVICE_UNIT="[Unit]
+Description=ThreatIntel Co-Pilot: MISP IOC extractor daemon
+After=network.target mysql.service mariadb.service
+
+[Service]
+Type=simple
+User=$(id -un)
+WorkingDirectory=$SCRIPT_DIR
+ExecStart=$(command -v python3) $EXTRACTOR_SCRIPT --daemon
+Restart=on-failure
+RestartSec=30
+
+[Install]
+WantedBy=multi-user.target"
+    if [ "$(id -u)" = "0" ] && command -v systemctl > /dev/null; then
+        echo "$SERVICE_UNIT" > "$SERVICE_FILE"
+        systemctl daemon-reload
+        systemctl enable --now "$SERVICE_NAME"
+        echo "IOC extractor daemon installed as the $SERVICE_NAME systemd service."
+    else
+        echo "$SERVICE_UNIT" > "$SCRIPT_DIR/$SERVICE_NAME.service"
+        echo "Run as root to install the daemon, or copy $SCRIPT_DIR/$SERVICE_NAME.service to $SERVICE_FILE"
+        echo "and run: systemctl daemon-reload && systemctl enable --now $SERVICE_NAME"
+    fi
+fi
+
 echo "Setup complete."
 echo "Note: Make sure to edit misp_db_config.json to set your database credentials."
 echo "The API key is stored in $CONFIG_FILE. Protect this file with appropriate permissions."
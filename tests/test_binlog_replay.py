@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Replays a recorded stretch of MISP binlog activity into a temporary cache.
+
+The recording in fixtures/binlog_changes.ndjson was captured with
+binlog.record_file and holds two committed transactions followed by the
+start of a third that never committed:
+
+1. event 9001 with an ip-dst, a domain and a sha256 attribute is created
+2. the domain is edited and the sha256 soft-deleted (deleted = 1)
+3. a url attribute is inserted, without a commit
+
+No MySQL server or replication library is needed.
+
+Usage:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import misp_db_extractor  # noqa: E402
+
+RECORDING = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'binlog_changes.ndjson')
+
+
+def replay(tmp_path, batch_size=1):
+    """
+    Replay the recording into a cache under tmp_path.
+
+    Args:
+        tmp_path: Directory for the cache and its sidecars
+        batch_size: binlog.batch_size; with 1 every transaction is written
+            on its own, so the soft delete removes a row already cached
+
+    Returns:
+        tuple: (number of IOC changes applied, SQLite connection to the cache)
+    """
+    config = misp_db_extractor.load_config()
+    config['extraction'] = dict(config['extraction'], enrichment=False)
+    config['binlog'] = dict(config.get('binlog', {}), batch_size=batch_size, flush_seconds=3600)
+    config['output'] = dict(
+        config['output'],
+        cache_db=str(tmp_path / 'ioc_cache.db'),
+        bloom_filter=str(tmp_path / 'ioc_cache.bloom'),
+        pattern_file=str(tmp_path / 'ioc_patterns.bin'),
+        retention_hours=None,
+    )
+    count = misp_db_extractor.Extractor(config=config).replay_binlog(RECORDING)
+    return count, sqlite3.connect(config['output']['cache_db'])
+
+
+def test_replay_upserts_committed_attributes(tmp_path):
+    count, conn = replay(tmp_path)
+    # Three inserts, then one update and one soft delete
+    assert count == 5
+    assert conn.execute('SELECT event_info FROM events WHERE event_id = 9001').fetchone() == ('Phishing campaign',)
+    assert conn.execute(
+        'SELECT attribute_value, canonical_value, attribute_comment FROM attributes WHERE attribute_id = 90002'
+    ).fetchone() == ('Login.EVIL[.]example', 'login.evil.example', 'phishing landing page')
+    assert conn.execute(
+        'SELECT canonical_value FROM attributes WHERE attribute_id = 90001'
+    ).fetchone() == ('198.51.100.7',)
+
+
+def test_replay_deletes_soft_deleted_attribute(tmp_path):
+    count, conn = replay(tmp_path)
+    assert conn.execute('SELECT COUNT(*) FROM attributes WHERE attribute_id = 90003').fetchone() == (0,)
+    assert conn.execute('SELECT COUNT(*) FROM hash_sha256 WHERE attribute_id = 90003').fetchone() == (0,)
+
+
+def test_replay_discards_unfinished_transaction(tmp_path):
+    count, conn = replay(tmp_path)
+    assert conn.execute('SELECT COUNT(*) FROM attributes WHERE attribute_id = 90004').fetchone() == (0,)
+    assert conn.execute('SELECT attribute_id FROM attributes ORDER BY attribute_id').fetchall() == [(90001,), (90002,)]
+
+
+def test_replay_stores_binlog_checkpoint(tmp_path):
+    count, conn = replay(tmp_path)
+    state = dict(conn.execute('SELECT key, value FROM extractor_state'))
+    assert state['binlog_file'] == 'mysql-bin.000042'
+    assert state['binlog_position'] == '5304'
+    assert state['schema_version'] == misp_db_extractor.SCHEMA_VERSION
+
+
+def test_replay_collapses_batched_transactions(tmp_path):
+    count, conn = replay(tmp_path, batch_size=1000)
+    # Both transactions are written together, so the sha256 is dropped
+    # before it reaches the cache and only two upserts remain
+    assert count == 2
+    assert conn.execute('SELECT attribute_id FROM attributes ORDER BY attribute_id').fetchall() == [(90001,), (90002,)]
+    assert dict(conn.execute('SELECT key, value FROM extractor_state'))['binlog_position'] == '5304'
+
+
+def test_empty_batch_keeps_cache_generation(tmp_path):
+    count, conn = replay(tmp_path)
+    generation = dict(conn.execute('SELECT key, value FROM extractor_state'))['cache_generation']
+    # A commit on a table the extractor does not follow
+    assert misp_db_extractor.write_binlog_batch([], ('mysql-bin.000042', 6012), str(tmp_path / 'ioc_cache.db')) == 0
+    state = dict(conn.execute('SELECT key, value FROM extractor_state'))
+    assert state['binlog_position'] == '6012'
+    assert state['cache_generation'] == generation